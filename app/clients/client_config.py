@@ -0,0 +1,39 @@
+"""
+Environment based configuration for the provider clients. Read once at import time so that the clients only do plain
+attribute lookups when building sessions and URLs.
+"""
+
+import os
+from collections import namedtuple
+
+ClientConfig = namedtuple('ClientConfig', [
+    'qbo_token_url',
+    'qbo_auth_host',
+    'qbo_api_host',
+    'qbo_base_api_uri',
+    'qbo_api_minor_version',
+    'xero_token_url',
+    'xero_auth_host',
+    'xero_access_url',
+    'xero_base_uri',
+    'zuora_base_api_uri',
+    'oauth1_base_redirect_uri',
+    'oauth2_base_redirect_uri',
+    'login_base_redirect_uri'
+])
+
+CONFIG = ClientConfig(
+    qbo_token_url=os.environ.get('QBO_TOKEN_URL'),
+    qbo_auth_host=os.environ.get('QBO_AUTH_HOST'),
+    qbo_api_host=os.environ.get('QBO_API_HOST'),
+    qbo_base_api_uri=os.environ.get('QBO_BASE_API_URI'),
+    qbo_api_minor_version=os.environ.get('QBO_API_MINOR_VERSION'),
+    xero_token_url=os.environ.get('XERO_TOKEN_URL'),
+    xero_auth_host=os.environ.get('XERO_AUTH_HOST'),
+    xero_access_url=os.environ.get('XERO_ACCESS_URL'),
+    xero_base_uri=os.environ.get('XERO_API_URL'),
+    zuora_base_api_uri=os.environ.get('ZUORA_BASE_API_URI'),
+    oauth1_base_redirect_uri=os.environ.get('OAUTH1_BASE_REDIRECT_URI'),
+    oauth2_base_redirect_uri=os.environ.get('OAUTH2_BASE_REDIRECT_URI'),
+    login_base_redirect_uri=os.environ.get('LOGIN_BASE_REDIRECT_URI')
+)
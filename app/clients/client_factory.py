@@ -2,66 +2,74 @@
 Factory for instantiating sessions based on provider
 """
 
-
-from app.clients.qbo_client import (
-    QboAuthorizationSession,
-    QboTokenSession,
-    QboApiSession
-)
-from app.clients.xero_client import (
-    XeroAuthorizationSession,
-    XeroTokenSession,
-    XeroApiSession
-)
-from app.clients.zuora_client import (
-    ZuoraAuthorizationSession,
-    ZuoraTokenSession,
-    ZuoraApiSession
-)
-from app.sync_states.qbo.sync_state import QboSyncState
-from app.sync_states.xero.sync_state import XeroSyncState
-from app.sync_states.zuora.sync_state import ZuoraSyncState
+import importlib
 
 
 # TODO: consider if these 3 classes can be combined into one (keeping in mind how to handle other providers so that the
 # linker stays generic
 
-authorization_session_classes = {
-    'qbo': QboAuthorizationSession,
-    'xerov2': XeroAuthorizationSession,
-    'zuora': ZuoraAuthorizationSession
+AUTHORIZATION_SESSION = 'authorization_session'
+TOKEN_SESSION = 'token_session'
+API_SESSION = 'api_session'
+SYNC_STATE = 'sync_state'
+
+# a single (kind, provider) lookup table for all the provider specific classes, given as (module, class name) so that
+# only the modules of the providers actually used by an instance get imported
+class_paths = {
+    (AUTHORIZATION_SESSION, 'qbo'): ('app.clients.qbo_client', 'QboAuthorizationSession'),
+    (AUTHORIZATION_SESSION, 'xerov2'): ('app.clients.xero_client', 'XeroAuthorizationSession'),
+    (AUTHORIZATION_SESSION, 'zuora'): ('app.clients.zuora_client', 'ZuoraAuthorizationSession'),
+
+    (TOKEN_SESSION, 'qbo'): ('app.clients.qbo_client', 'QboTokenSession'),
+    (TOKEN_SESSION, 'xerov2'): ('app.clients.xero_client', 'XeroTokenSession'),
+    (TOKEN_SESSION, 'zuora'): ('app.clients.zuora_client', 'ZuoraTokenSession'),
+
+    (API_SESSION, 'qbo'): ('app.clients.qbo_client', 'QboApiSession'),
+    (API_SESSION, 'xerov2'): ('app.clients.xero_client', 'XeroApiSession'),
+    (API_SESSION, 'zuora'): ('app.clients.zuora_client', 'ZuoraApiSession'),
+
+    (SYNC_STATE, 'qbo'): ('app.sync_states.qbo.sync_state', 'QboSyncState'),
+    (SYNC_STATE, 'xerov2'): ('app.sync_states.xero.sync_state', 'XeroSyncState'),
+    (SYNC_STATE, 'zuora'): ('app.sync_states.zuora.sync_state', 'ZuoraSyncState')
 }
 
-token_session_classes = {
-    'qbo': QboTokenSession,
-    'xerov2': XeroTokenSession,
-    'zuora': ZuoraTokenSession
-}
+# classes resolved from class_paths, keyed by (kind, provider)
+_classes = {}
 
-api_session_classes = {
-    'qbo': QboApiSession,
-    'xerov2': XeroApiSession,
-    'zuora': ZuoraApiSession
-}
 
-sync_states = {
-    'qbo': QboSyncState,
-    'xerov2': XeroSyncState,
-    'zuora': ZuoraSyncState
-}
+def _get_class(kind, provider):
+    """
+    Resolves the class of the given kind for a provider, importing its module on first use.
+
+    Args:
+        kind(str): one of AUTHORIZATION_SESSION, TOKEN_SESSION, API_SESSION or SYNC_STATE
+        provider(str): the provider (e.g qbo, xerov2)
+
+    Returns:
+        type: the provider specific class
+    """
+    key = (kind, provider)
+    cls = _classes.get(key)
+
+    if cls is None:
+        module_name, class_name = class_paths[key]
+        cls = getattr(importlib.import_module(module_name), class_name)
+        _classes[key] = cls
+
+    return cls
 
 
 def get_authorization_session(provider, *args):
-    return authorization_session_classes[provider](*args)
+    return _get_class(AUTHORIZATION_SESSION, provider)(*args)
 
 
 def get_token_session(provider, *args):
-    return token_session_classes[provider](*args)
+    return _get_class(TOKEN_SESSION, provider)(*args)
 
 
 def get_api_session(provider, *args):
-    return api_session_classes[provider](*args)
+    return _get_class(API_SESSION, provider)(*args)
 
 
 def get_sync_state(provider):
-    return sync_states[provider]
+    return _get_class(SYNC_STATE, provider)
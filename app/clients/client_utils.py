@@ -2,16 +2,18 @@
 Contains methods used by client classes
 """
 
-import os
+from requests.exceptions import RequestException
+from urllib3.exceptions import HTTPError as Urllib3HTTPError
+
+from app.clients.client_config import CONFIG
 
 BASIC_AUTH_PROVIDERS = {'zuora'}
 OAUTH1_PROVIDERS = {'xerov2'}
 OAUTH2_PROVIDERS = {'qbo'}
 
-OAUTH1_BASE_REDIRECT_URI = os.environ.get("OAUTH1_BASE_REDIRECT_URI")
-OAUTH2_BASE_REDIRECT_URI = os.environ.get("OAUTH2_BASE_REDIRECT_URI")
-LOGIN_BASE_REDIRECT_URI = os.environ.get("LOGIN_BASE_REDIRECT_URI")
-
+# exceptions raised by failed http calls. the urlfetch adapter lets some urllib3 exceptions (like TimeoutError and
+# AppEnginePlatformError) through without wrapping them, so those are included alongside the requests ones
+TRANSPORT_EXCEPTIONS = (RequestException, Urllib3HTTPError)
 
 def get_redirect_uri_for(provider, org_uid=None):
     """
@@ -24,10 +26,9 @@ def get_redirect_uri_for(provider, org_uid=None):
     Returns:
         (str) The redirect URI
     """
-
     if provider in OAUTH1_PROVIDERS:
-        return OAUTH1_BASE_REDIRECT_URI.format(org_uid)
+        return CONFIG.oauth1_base_redirect_uri.format(org_uid)
     elif provider in BASIC_AUTH_PROVIDERS:
-        return LOGIN_BASE_REDIRECT_URI.format(provider, org_uid)
+        return CONFIG.login_base_redirect_uri.format(provider, org_uid)
     else:
-        return OAUTH2_BASE_REDIRECT_URI
+        return CONFIG.oauth2_base_redirect_uri
@@ -6,17 +6,15 @@ passed in when authorizing, but can't be when getting the token).
 """
 
 
-import base64
-import os
-import json
 import logging
-from datetime import datetime
+import time
+from requests.auth import HTTPBasicAuth
 from requests_oauthlib import OAuth2Session
 from oauthlib.oauth2.rfc6749.errors import InvalidGrantError
-from google.appengine.api import urlfetch
 from google.appengine.ext import ndb
 
 from app.clients import client_utils
+from app.clients.client_config import CONFIG
 from app.services.ndb_models import Org, OrgCredentials
 from app.utils.sync_utils import (
     AuthCancelled,
@@ -29,12 +27,17 @@ from app.utils.sync_utils import (
     MissingProviderConfigException
 )
 
-TOKEN_URL = os.environ.get('QBO_TOKEN_URL')
-AUTH_HOST = os.environ.get('QBO_AUTH_HOST')
-API_HOST = os.environ.get('QBO_API_HOST')
 SCOPES = ['com.intuit.quickbooks.accounting']
-BASE_API_URI = os.environ.get('QBO_BASE_API_URI')
-API_MINOR_VERSION = os.environ.get('QBO_API_MINOR_VERSION')
+
+# urlfetch deadline (in seconds) for the calls made while linking, passed per call as the default deadline is
+# thread-local and set per request by AppEngineMiddleware
+LINKING_API_CALL_TIMEOUT = 10
+
+# exceptions raised for api responses with these status codes, any other non-200 status raises a ValueError
+STATUS_CODE_EXCEPTIONS = {
+    429: RateLimitException,
+    401: UnauthorizedApiCallException
+}
 
 
 class QboAuthorizationSession(OAuth2Session):
@@ -58,12 +61,13 @@ class QboAuthorizationSession(OAuth2Session):
         if org.provider_config is None:
             org.provider_config = provider_config.key
 
-        msg = "setting org status to linking (status {}) and saving redirect_url ({})'"
-        logging.info(msg.format(LINKING, redirect_url))
+        logging.info("setting org status to linking (status %s) and saving redirect_url (%s)'", LINKING, redirect_url)
 
         org.status = LINKING
         org.redirect_url = redirect_url
-        org.put()
+
+        # the org only needs to be saved before the user is redirected, so it is waited on in get_authorization_url
+        self._pending_puts = [org.put_async()]
 
         callback_uri = client_utils.get_redirect_uri_for(org.provider)
         super(QboAuthorizationSession, self).__init__(
@@ -80,7 +84,10 @@ class QboAuthorizationSession(OAuth2Session):
         Returns:
             str: url to which the user should be redirected to in order to complete the auth flow
         """
-        authorization_url, _ = self.authorization_url(AUTH_HOST)
+        authorization_url, _ = self.authorization_url(CONFIG.qbo_auth_host)
+        # get_result raises if a save failed, wait_all would not
+        for future in self._pending_puts:
+            future.get_result()
         return authorization_url
 
 
@@ -110,7 +117,7 @@ class QboTokenSession(OAuth2Session):
         if self.org.entity_id and self.org.entity_id != entity_id:
             raise MismatchingFileConnectionAttempt(self.org)
 
-        logging.info("saving entity_id '{}' for org '{}'".format(entity_id, org_uid))
+        logging.info("saving entity_id '%s' for org '%s'", entity_id, org_uid)
         self.org.entity_id = entity_id
         self.org.put()
 
@@ -125,12 +132,10 @@ class QboTokenSession(OAuth2Session):
         """
         provider_config = self.org.provider_config.get()
         token = self.fetch_token(
-            TOKEN_URL,
+            CONFIG.qbo_token_url,
             code=self.callback_args.get('code'),
+            auth=_get_basic_auth(provider_config),
             headers={
-                'Authorization': "Basic " + base64.b64encode(
-                    provider_config.client_id + ":" + provider_config.client_secret
-                ),
                 'Accept': 'application/json',
                 'content-type': 'application/x-www-form-urlencoded'
             }
@@ -154,19 +159,20 @@ class QboApiSession(OAuth2Session):
         parent = ndb.Key('Org', org_uid)
         self.org_uid = org_uid
         org = parent.get_async()
-        self.creds = OrgCredentials.get_by_id(org_uid, parent=parent)
-        expires_at = datetime.utcfromtimestamp(self.creds.token['expires_at'])
+        creds = OrgCredentials.get_by_id_async(org_uid, parent=parent)
+        self.creds = creds.get_result()
 
         # TODO: this call and refresh_token function might not be needed as OAuth2Session can take auto_refresh_url
         # as a parameter and do this automatically
-        provider_config_key = org.get_result().provider_config
+        self.org = org.get_result()
+        provider_config_key = self.org.provider_config
         if provider_config_key is None:
-            logging.warn("org `{}` does not have a provider config.".format(parent.id()))
+            logging.warn("org `%s` does not have a provider config.", parent.id())
             raise MissingProviderConfigException()
         else:
             self.provider_config = provider_config_key.get()
-        if (expires_at - datetime.utcnow()).total_seconds() < 60:
-            logging.info("access token for {} about to expire, refreshing".format(self.org_uid))
+        if self.creds.token['expires_at'] - time.time() < 60:
+            logging.info("access token for %s about to expire, refreshing", self.org_uid)
             self.refresh_token()
 
         super(QboApiSession, self).__init__(self.provider_config.client_id, token=self.creds.token)
@@ -177,12 +183,10 @@ class QboApiSession(OAuth2Session):
         """
         try:
             token = OAuth2Session().refresh_token(
-                token_url=TOKEN_URL,
+                token_url=CONFIG.qbo_token_url,
                 refresh_token=self.creds.token['refresh_token'],
+                auth=_get_basic_auth(self.provider_config),
                 headers={
-                    'Authorization': "Basic " + base64.b64encode(
-                        self.provider_config.client_id + ":" + self.provider_config.client_secret
-                    ),
                     'Accept': 'application/json',
                     'content-type': 'application/x-www-form-urlencoded'
                 }
@@ -192,8 +196,8 @@ class QboApiSession(OAuth2Session):
             raise InvalidGrantException()
 
         parent = ndb.Key('Org', self.org_uid)
-        OrgCredentials(parent=parent, id=self.org_uid, token=token).put()
-        self.creds = OrgCredentials.get_by_id(self.org_uid, parent=parent)
+        self.creds = OrgCredentials(parent=parent, id=self.org_uid, token=token)
+        self.creds.put()
 
     def get_company_name(self):
         """
@@ -202,20 +206,28 @@ class QboApiSession(OAuth2Session):
         Returns:
             str: company name
         """
-        entity_id = Org.get_by_id(self.org_uid).entity_id
-        url_template = "{}company/{}/companyinfo/{}?minorversion={}"
-        url = url_template.format(BASE_API_URI, entity_id, entity_id, API_MINOR_VERSION)
+        url = self._get_company_info_url()
 
         try:
-            urlfetch.set_default_fetch_deadline(10)
-            data = self.get(url, headers={'Accept': 'application/json'})
+            data = self.get(url, headers={'Accept': 'application/json'}, timeout=LINKING_API_CALL_TIMEOUT)
         except Exception:
             # we don't want this to interrupt the linking flow
-            logging.warning("failed to get company name for entity {}".format(entity_id), exc_info=True)
+            logging.warning("failed to get company name for entity %s", self.org.entity_id, exc_info=True)
             raise FailedToGetCompanyName()
 
         return data.get('CompanyInfo', {}).get('CompanyName')
 
+    def _get_company_info_url(self):
+        """
+        Builds the URL of the CompanyInfo endpoint for the org.
+
+        Returns:
+            str: CompanyInfo URL
+        """
+        entity_id = self.org.entity_id
+        url_template = "{}company/{}/companyinfo/{}?minorversion={}"
+        return url_template.format(CONFIG.qbo_base_api_uri, entity_id, entity_id, CONFIG.qbo_api_minor_version)
+
     def request(self, method, url, data=None, headers=None, withhold_token=False, client_id=None, client_secret=None, **kwargs):
         """
         Overrides the OAuth2Session request method to handle QBO specific errors. Based on this handling here the parent
@@ -235,18 +247,16 @@ class QboApiSession(OAuth2Session):
             **kwargs
         )
 
-        if response.status_code == 429:
-            logging.info("got a 429 - {}".format(response.text))
-            raise RateLimitException()
+        if response.status_code != 200:
+            logging.info(u"got response with status: %s, and response: %s", response.status_code, response.text)
 
-        if response.status_code == 401:
-            raise UnauthorizedApiCallException()
+            exception = STATUS_CODE_EXCEPTIONS.get(response.status_code)
+            if exception:
+                raise exception()
 
-        if response.status_code != 200:
-            logging.info(u"got response with status: {}, and response: {}".format(response.status_code, response.text))
             raise ValueError("api call failed with code {}: url - {}".format(response.status_code, url))
 
-        data = json.loads(response.text)
+        data = response.json()
 
         if 'Fault' in data:
             raise ValueError("api call failed: url - {}, data - {}".format(url, data))
@@ -255,7 +265,8 @@ class QboApiSession(OAuth2Session):
 
     def is_authenticated(self):
         """
-        Provides on-demand checking of the ability to make API calls for an org.
+        Provides on-demand checking of the ability to make API calls for an org. Only the status of the CompanyInfo
+        call is checked, the response body is not parsed.
 
         Args:
             org_uid(str): org identifier
@@ -265,9 +276,27 @@ class QboApiSession(OAuth2Session):
         """
 
         try:
-            company_name = self.get_company_name()
-        except Exception as e:
-            logging.exception("got an error checking if auth is ok", e)
+            response = super(QboApiSession, self).request(
+                'GET',
+                self._get_company_info_url(),
+                headers={'Accept': 'application/json'},
+                timeout=LINKING_API_CALL_TIMEOUT
+            )
+        except client_utils.TRANSPORT_EXCEPTIONS as e:
+            logging.warning("got an error checking if auth is ok: %s", type(e).__name__)
             return False
 
-        return company_name is not None
+        return response.status_code == 200
+
+
+def _get_basic_auth(provider_config):
+    """
+    Builds the Basic auth for the token endpoint.
+
+    Args:
+        provider_config(ProviderConfig): ndb model holding the client id and secret
+
+    Returns:
+        HTTPBasicAuth: the auth to pass to token requests
+    """
+    return HTTPBasicAuth(provider_config.client_id, provider_config.client_secret)
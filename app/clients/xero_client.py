@@ -8,16 +8,15 @@ Note: Both application types tokens last for 30 minutes.
 """
 
 import logging
-import os
+import time
 
-from google.appengine.api import urlfetch
 from google.appengine.ext import ndb
-import calendar
 from app.clients import client_utils
+from app.clients.client_config import CONFIG
 
-from requests_oauthlib import OAuth1Session
+from requests import post
+from requests_oauthlib import OAuth1, OAuth1Session
 from app.services.ndb_models import Org, OrgCredentials
-from datetime import datetime, timedelta
 from app.utils.sync_utils import (
     FailedToGetCompanyName,
     LINKING,
@@ -33,15 +32,23 @@ import json as json_module
 logging.getLogger("requests").setLevel(logging.DEBUG)
 logging.getLogger("urllib3").setLevel(logging.INFO)
 
-TOKEN_URL = os.environ.get('XERO_TOKEN_URL')
-AUTH_HOST = os.environ.get('XERO_AUTH_HOST')
-ACCESS_URL = os.environ.get('XERO_ACCESS_URL')
-XERO_BASE_URI = os.environ.get('XERO_API_URL')
-
 RSA = 'RSA-SHA1'
 HMAC = 'HMAC-SHA1'
 PARTNER = 'partner'
 
+# urlfetch deadline (in seconds) for the calls made while linking, passed per call as the default deadline is
+# thread-local and set per request by AppEngineMiddleware
+LINKING_API_CALL_TIMEOUT = 10
+
+ORGANISATIONS_URL = "{}/Organisations".format(CONFIG.xero_base_uri)
+
+# exceptions raised for api responses with these status codes, any other non-200 status raises a ValueError
+STATUS_CODE_EXCEPTIONS = {
+    429: RateLimitException,
+    401: UnauthorizedApiCallException,
+    403: ForbiddenApiCallException
+}
+
 
 class XeroAuthorizationSession(OAuth1Session):
     """
@@ -64,21 +71,15 @@ class XeroAuthorizationSession(OAuth1Session):
         if org.provider_config is None:
             org.provider_config = provider_config.key
 
-        logging.info(
-            "Provider secret = {} provider id {}".format(
-                provider_config.client_secret,
-                provider_config.client_id
-            )
-        )
-
-        msg = "setting org status to linking (status {}) and saving redirect_url ({})'"
-        logging.info(msg.format(LINKING, redirect_url))
+        logging.info("setting org status to linking (status %s) and saving redirect_url (%s)'", LINKING, redirect_url)
 
         org.status = LINKING
         org.redirect_url = redirect_url
-        org.put()
 
-        rsa_key, rsa_method = _get_partner_session_attrs(provider_config)
+        # the org only needs to be saved before the user is redirected, so it is waited on in get_authorization_url
+        self._pending_puts = [org.put_async()]
+
+        rsa_key, rsa_method = _get_partner_session_attrs(_get_auth_attrs(provider_config))
         callback_uri = client_utils.get_redirect_uri_for(org.provider, org_uid)
         self.org_uid = org_uid
 
@@ -98,10 +99,13 @@ class XeroAuthorizationSession(OAuth1Session):
             str: url to which the user should be redirected to in order to complete the auth flow
         """
 
-        request_token = self.fetch_request_token(TOKEN_URL)
-        authorization_url = self.authorization_url(AUTH_HOST)
+        request_token = self.fetch_request_token(CONFIG.xero_token_url)
+        authorization_url = self.authorization_url(CONFIG.xero_auth_host)
         parent = ndb.Key('Org', self.org_uid)
-        OrgCredentials(parent=parent, id=self.org_uid, token=request_token).put()
+        self._pending_puts.append(OrgCredentials(parent=parent, id=self.org_uid, token=request_token).put_async())
+        # get_result raises if a save failed, wait_all would not
+        for future in self._pending_puts:
+            future.get_result()
         return authorization_url
 
 
@@ -123,7 +127,7 @@ class XeroTokenSession(OAuth1Session):
         self.callback_args = callback_args
         self.org = Org.get_by_id(org_uid)
         self.provider = self.org.provider_config.get()
-        rsa_key, rsa_method = _get_partner_session_attrs(self.provider)
+        rsa_key, rsa_method = _get_partner_session_attrs(_get_auth_attrs(self.provider))
         request_token = OrgCredentials.get_by_id(self.org_uid, parent=self.org.key).token
 
         super(XeroTokenSession, self).__init__(
@@ -137,7 +141,7 @@ class XeroTokenSession(OAuth1Session):
         )
 
     def get_and_save_token(self):
-        token = _process_token(self.fetch_access_token(ACCESS_URL))
+        token = _process_token(self.fetch_access_token(CONFIG.xero_access_url))
         parent = ndb.Key('Org', self.org_uid)
         OrgCredentials(parent=parent, id=self.org_uid, token=token).put()
 
@@ -163,31 +167,34 @@ class XeroApiSession(OAuth1Session):
         parent = ndb.Key('Org', org_uid)
         self.org_uid = org_uid
         org = parent.get_async()
-        self.creds = OrgCredentials.get_by_id(org_uid, parent=parent)
+        creds = OrgCredentials.get_by_id_async(org_uid, parent=parent)
+        self.creds = creds.get_result()
 
         self.current_token = self.creds.token
-        expires_at = datetime.utcfromtimestamp((self.creds.token['expires_at']))
+
+        # the Organisations record, fetched on first use (see _get_organisation)
+        self._organisation = None
 
         self.org = org.get_result()
         provider_config_key = self.org.provider_config
 
         if provider_config_key is None:
-            logging.warn("org `{}` does not have a provider config.".format(parent.id()))
+            logging.warn("org `%s` does not have a provider config.", parent.id())
             raise MissingProviderConfigException
         else:
             self.provider_config = provider_config_key.get()
 
-        auth_attrs = json_module.loads(self.provider_config.additional_auth_attributes)
+        auth_attrs = _get_auth_attrs(self.provider_config)
 
-        if (expires_at - datetime.utcnow()).total_seconds() < 60:
-            logging.info("access token for {} about to expire, refreshing".format(self.org_uid))
+        if self.current_token['expires_at'] - time.time() < 60:
+            logging.info("access token for %s about to expire, refreshing", self.org_uid)
 
             if auth_attrs['application_type'] == PARTNER:
                 self.refresh_token(auth_attrs['rsa_key'])
             else:
                 logging.info("application type is `public`. Skipping refresh.")
 
-        rsa_key, sig_method = _get_partner_session_attrs(self.provider_config)
+        rsa_key, sig_method = _get_partner_session_attrs(auth_attrs)
 
         super(XeroApiSession, self).__init__(
             self.provider_config.client_id,
@@ -207,7 +214,7 @@ class XeroApiSession(OAuth1Session):
             rsa_key (str): The RSA key
         """
 
-        oauth = OAuth1Session(
+        auth = OAuth1(
             self.provider_config.client_id,
             client_secret=self.provider_config.client_secret,
             resource_owner_key=self.current_token['oauth_token'],
@@ -217,15 +224,16 @@ class XeroApiSession(OAuth1Session):
         )
 
         try:
-            resp = oauth.post(
-                ACCESS_URL,
-                params={'oauth_session_handle': self.current_token['oauth_session_handle']}
+            resp = post(
+                CONFIG.xero_access_url,
+                params={'oauth_session_handle': self.current_token['oauth_session_handle']},
+                auth=auth
             )
         except Exception as e:
-            logging.error("failed to refresh token", e)
+            logging.error("failed to refresh token: %s", e)
             raise DisconnectException()
 
-        self.current_token = _process_token(json_module.loads(resp.text))
+        self.current_token = _process_token(resp.json())
         parent = ndb.Key('Org', self.org_uid)
         OrgCredentials(parent=parent, id=self.org_uid, token=self.current_token).put()
 
@@ -237,15 +245,12 @@ class XeroApiSession(OAuth1Session):
             str: company name
         """
 
-        url = "{}/Organisations".format(XERO_BASE_URI)
         try:
-            urlfetch.set_default_fetch_deadline(10)
-            data = self.get(url, headers={'Accept': 'application/json'})
+            data = self._get_organisation()
         except Exception:
             # we don't want this to interrupt the linking flow
-            logging.warning("failed to get company name for org {}".format(self.org_uid), exc_info=True)
+            logging.warning("failed to get company name for org %s", self.org_uid, exc_info=True)
             raise FailedToGetCompanyName()
-        data = data['Organisations'][0]
 
         # store ShortCode on first link.
         if self.org.entity_id is None:
@@ -261,20 +266,33 @@ class XeroApiSession(OAuth1Session):
         Returns:
             str: The Company ShortCode
         """
-        url = "{}/Organisations".format(XERO_BASE_URI)
         try:
-            urlfetch.set_default_fetch_deadline(10)
-            data = self.get(url, headers={'Accept': 'application/json'})
+            data = self._get_organisation()
         except Exception:
             # we don't want this to interrupt the linking flow
-            logging.warning("failed to get ShortCode for org {}".format(self.org_uid), exc_info=True)
+            logging.warning("failed to get ShortCode for org %s", self.org_uid, exc_info=True)
             raise DisconnectException()
 
-        return data['Organisations'][0]['ShortCode']
+        return data['ShortCode']
+
+    def _get_organisation(self):
+        """
+        Makes an API call to Xero to get the organisation details. The response is kept on the session so that the
+        company name and the ShortCode can both be read with one call.
+
+        Returns:
+            dict: the organisation details
+        """
+        if self._organisation is None:
+            data = self.get(ORGANISATIONS_URL, headers={'Accept': 'application/json'}, timeout=LINKING_API_CALL_TIMEOUT)
+            self._organisation = data['Organisations'][0]
+
+        return self._organisation
 
     def is_authenticated(self):
         """
-        Provides on-demand checking of the ability to make API calls for an org.
+        Provides on-demand checking of the ability to make API calls for an org. Only the status of the Organisations
+        call is checked, the response body is not parsed.
 
         Args:
             org_uid(str): org identifier
@@ -284,12 +302,17 @@ class XeroApiSession(OAuth1Session):
         """
 
         try:
-            company_name = self.get_company_name()
-        except Exception as e:
-            logging.exception("got an error checking if auth is ok", e)
+            response = super(XeroApiSession, self).request(
+                'GET',
+                ORGANISATIONS_URL,
+                headers={'Accept': 'application/json'},
+                timeout=LINKING_API_CALL_TIMEOUT
+            )
+        except client_utils.TRANSPORT_EXCEPTIONS as e:
+            logging.warning("got an error checking if auth is ok: %s", type(e).__name__)
             return False
 
-        return company_name is not None
+        return response.status_code == 200
 
     def request(self, method, url,
             params=None, data=None, headers=None, cookies=None, files=None,
@@ -321,26 +344,34 @@ class XeroApiSession(OAuth1Session):
             json=json
         )
 
-        if response.status_code == 429:
-            logging.info("got a 429 - {}".format(response.text))
-            raise RateLimitException()
-
-        elif response.status_code == 401:
-            raise UnauthorizedApiCallException()
+        if response.status_code != 200:
+            logging.info(u"got response with status: %s, and response: %s", response.status_code, response.text)
 
-        elif response.status_code == 403:
-            raise ForbiddenApiCallException()
+            exception = STATUS_CODE_EXCEPTIONS.get(response.status_code)
+            if exception:
+                raise exception()
 
-        if response.status_code != 200:
-            logging.info(u"got response with status: {}, and response: {}".format(response.status_code, response.text))
             raise ValueError("api call failed with code {}: url - {}".format(response.status_code, url))
 
-        data = json_module.loads(response.text)
+        data = response.json()
 
         return data
 
 
-def _get_partner_session_attrs(provider_config):
+def _get_auth_attrs(provider_config):
+    """
+    Parses the additional auth attributes of a provider config.
+
+    Args:
+        provider_config (ProviderConfig): The ProviderConfig containing the auth attributes
+
+    Returns:
+        dict: The parsed auth attributes
+    """
+    return json_module.loads(provider_config.additional_auth_attributes)
+
+
+def _get_partner_session_attrs(auth_attrs):
     """
     Method to retrieve additional attributes to be used for the OAuth1Session depending
     on the application type being public or private.
@@ -349,13 +380,11 @@ def _get_partner_session_attrs(provider_config):
     Partner - RSA key to be used with RSA-SHA1 signature method
 
     Args:
-        provider_config (ProviderConfig): The ProviderConfig containing the auth attributes
+        auth_attrs (dict): The parsed auth attributes of the ProviderConfig
 
     Returns:
         (str, str): The RSA key and Signature Method
     """
-    auth_attrs = json_module.loads(provider_config.additional_auth_attributes)
-
     if auth_attrs['application_type'] == PARTNER:
         return auth_attrs['rsa_key'], RSA
     else:
@@ -373,8 +402,7 @@ def _process_token(token):
         The updated access tocken
     """
     if 'oauth_expires_in' in token:
-        expires_at = datetime.utcnow() + timedelta(seconds=int(token['oauth_expires_in']))
-        token['expires_at'] = calendar.timegm(expires_at.utctimetuple())
+        token['expires_at'] = int(time.time()) + int(token['oauth_expires_in'])
 
     return token
 
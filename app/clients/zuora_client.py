@@ -5,16 +5,14 @@ Note: Currently Zuora uses basic authentication via username/password
 """
 
 
-import os
-import json as json_module
 import logging
-import calendar
-from datetime import datetime, timedelta
+import time
 
 from requests import Session, post
 from google.appengine.ext import ndb
 
 from app.clients import client_utils
+from app.clients.client_config import CONFIG
 from app.services.ndb_models import Org, OrgCredentials, UserCredentials
 from app.utils.sync_utils import (
     LINKING,
@@ -24,7 +22,21 @@ from app.utils.sync_utils import (
     ForbiddenApiCallException
 )
 
-BASE_API_URI = os.environ.get('ZUORA_BASE_API_URI')
+# exceptions raised for api responses with these status codes, any other non-200 status raises a ValueError
+STATUS_CODE_EXCEPTIONS = {
+    429: RateLimitException,
+    401: UnauthorizedApiCallException,
+    403: ForbiddenApiCallException
+}
+
+ACCOUNTING_CODES_URL = '{}/accounting-codes'.format(CONFIG.zuora_base_api_uri)
+CONNECTIONS_URL = '{}/connections'.format(CONFIG.zuora_base_api_uri)
+
+# headers sent with every session cookie request
+CONNECTIONS_HEADERS = {
+    'Accept': 'application/json',
+    'content-type': 'application/json'
+}
 
 
 class ZuoraAuthorizationSession:
@@ -49,12 +61,13 @@ class ZuoraAuthorizationSession:
         if org.provider_config is None:
             org.provider_config = provider_config.key
 
-        msg = "setting org status to linking (status {}) and saving redirect_url ({})'"
-        logging.info(msg.format(LINKING, redirect_url))
+        logging.info("setting org status to linking (status %s) and saving redirect_url (%s)'", LINKING, redirect_url)
 
         org.status = LINKING
         org.redirect_url = redirect_url
-        org.put()
+
+        # the org only needs to be saved before the user is redirected, so it is waited on in get_authorization_url
+        self._pending_puts = [org.put_async()]
 
         self.org = org
 
@@ -65,15 +78,18 @@ class ZuoraAuthorizationSession:
         Returns:
             str: url to which the user should be redirected to in order to complete the auth flow
         """
+        # get_result raises if a save failed, wait_all would not
+        for future in self._pending_puts:
+            future.get_result()
         return client_utils.get_redirect_uri_for(self.org.provider, self.org.key.string_id())
 
 
-class ZuoraTokenSession(Session):
+class ZuoraTokenSession(object):
     """Class to facilitate exchange of auth code for access token. Zuora uses a session cookie"""
 
     def __init__(self, org_uid, username, password):
         """
-        Stores the users Zuora credentials into a UserCredentials ndb model
+        Prepares the users Zuora credentials as a UserCredentials ndb model (saved with the session cookie)
         Args:
             org_uid(str): org identifier
             username(str): zuora username
@@ -83,12 +99,13 @@ class ZuoraTokenSession(Session):
         self.org_uid = org_uid
         parent = ndb.Key('Org', org_uid)
         self.user_creds = UserCredentials(parent=parent, id=org_uid, username=username, password=password)
-        self.user_creds.put()
         # TODO: Handle errors (File mismatch etc..)
 
     def get_and_save_token(self):
         """Retrieves a session cookie from Zuora via the user credentials"""
-        _get_session_cookie(self.user_creds)
+        # the user credentials and the session cookie are saved in one batch, synchronously as the linker reads the
+        # credentials straight after
+        ndb.put_multi([self.user_creds, _get_session_cookie(self.user_creds)])
 
 
 class ZuoraApiSession(Session):
@@ -103,26 +120,26 @@ class ZuoraApiSession(Session):
         Args:
             org_uid(str): org identifier
         """
+        super(ZuoraApiSession, self).__init__()
+
         parent = ndb.Key('Org', org_uid)
         self.org_uid = org_uid
         org = parent.get_async()
-        self.creds = OrgCredentials.get_by_id(org_uid, parent=parent)
-        expires_at = datetime.utcfromtimestamp(self.creds.token['expires_at'])
+        creds = OrgCredentials.get_by_id_async(org_uid, parent=parent)
+        self.creds = creds.get_result()
 
         provider_config_key = org.get_result().provider_config
         if provider_config_key is None:
-            logging.warn("org `{}` does not have a provider config.".format(parent.id()))
+            logging.warn("org `%s` does not have a provider config.", parent.id())
             raise MissingProviderConfigException()
         else:
             self.provider_config = provider_config_key.get()
 
-        if (expires_at - datetime.utcnow()).total_seconds() < 60:
-            logging.info("access token for {} about to expire, refreshing".format(self.org_uid))
+        if self.creds.token['expires_at'] - time.time() < 60:
+            logging.info("access token for %s about to expire, refreshing", self.org_uid)
             self.refresh_token()
             self.access_token = self.creds.token['access_token']
 
-        super(ZuoraApiSession, self).__init__()
-
     def refresh_token(self):
         """
         Refreshes the session cookie for the org
@@ -130,8 +147,8 @@ class ZuoraApiSession(Session):
         parent = ndb.Key('Org', self.org_uid)
         user_creds = UserCredentials.get_by_id(self.org_uid, parent=parent)
 
-        _get_session_cookie(user_creds)
-        self.creds = OrgCredentials.get_by_id(self.org_uid, parent=parent)
+        self.creds = _get_session_cookie(user_creds)
+        self.creds.put()
 
     def get_company_name(self):
         """
@@ -146,7 +163,8 @@ class ZuoraApiSession(Session):
 
     def is_authenticated(self):
         """
-        Provides on-demand checking of the ability to make API calls for an org.
+        Provides on-demand checking of the ability to make API calls for an org. Only one accounting code is requested
+        as the check only needs the success flag of the response.
 
         Args:
             org_uid(str): org identifier
@@ -155,27 +173,19 @@ class ZuoraApiSession(Session):
             bool: true if api calls can be made, false if not
         """
 
-        url = '{}/accounting-codes'.format(BASE_API_URI)
-
         try:
             api_response = self.get(
-                url,
-                headers={
-                    'Cookie': self.creds.token['access_token'],
-                    'Accept': 'application/json'
-                },
+                ACCOUNTING_CODES_URL,
+                params={'pageSize': 1},
+                headers={'Accept': 'application/json'}
             )
-        except Exception:
-            logging.exception("got an error checking if auth is ok")
+        except (UnauthorizedApiCallException, ForbiddenApiCallException) + client_utils.TRANSPORT_EXCEPTIONS as e:
+            logging.warning("got an error checking if auth is ok: %s", type(e).__name__)
             return False
 
         return api_response['success'] is True
 
-    def request(self, method, url,
-                params=None, data=None, headers=None, cookies=None, files=None,
-                auth=None, timeout=None, allow_redirects=True, proxies=None,
-                hooks=None, stream=None, verify=None, cert=None, json=None):
-
+    def request(self, method, url, headers=None, **kwargs):
         """
         Overrides the session request method to handle Zuora specific errors. Based on this handling here the parent
         sync loop decides if it should retry API calls. This method also adds the session cookie encapsulated by
@@ -191,42 +201,19 @@ class ZuoraApiSession(Session):
 
         headers['Cookie'] = self.creds.token['access_token']
 
-        response = super(ZuoraApiSession, self).request(
-            method,
-            url,
-            params=params,
-            data=data,
-            headers=headers,
-            cookies=cookies,
-            files=files,
-            auth=auth,
-            timeout=timeout,
-            allow_redirects=allow_redirects,
-            proxies=proxies,
-            hooks=hooks,
-            stream=stream,
-            verify=verify,
-            cert=cert,
-            json=json
-        )
-
-        if response.status_code == 429:
-            logging.info("got a 429 - {}".format(response.text))
-            raise RateLimitException()
-
-        elif response.status_code == 401:
-            raise UnauthorizedApiCallException()
-
-        elif response.status_code == 403:
-            raise ForbiddenApiCallException()
+        response = super(ZuoraApiSession, self).request(method, url, headers=headers, **kwargs)
 
         if response.status_code != 200:
-            logging.info(u"got response with status: {}, and response: {}".format(response.status_code, response.text))
+            logging.info(u"got response with status: %s, and response: %s", response.status_code, response.text)
+
+            exception = STATUS_CODE_EXCEPTIONS.get(response.status_code)
+            if exception:
+                raise exception()
+
             raise ValueError("api call failed with code {}: url - {}".format(response.status_code, url))
 
-        data = json_module.loads(response.text)
+        return response.json()
 
-        return data
 
 def _get_session_cookie(user_creds):
     """ Method to fetch a session cookie from the Zuora API. A session cookies duration time can
@@ -236,24 +223,22 @@ def _get_session_cookie(user_creds):
 
     Args:
         user_creds(UserCredentials): The users credentials
+
+    Returns:
+        OrgCredentials: the (unsaved) credentials holding the session cookie, callers decide how to save them
     """
-    session_cookie_url = '{}/connections'.format(BASE_API_URI)
-    session_cookie_response = post(
-        session_cookie_url,
-        headers={
-            'apiAccessKeyId': user_creds.username,
-            'apiSecretAccessKey': user_creds.password,
-            'Accept': 'application/json',
-            'content-type': 'application/json'
-        }
-    )
+    headers = dict(CONNECTIONS_HEADERS)
+    headers.update({
+        'apiAccessKeyId': user_creds.username,
+        'apiSecretAccessKey': user_creds.password
+    })
+    session_cookie_response = post(CONNECTIONS_URL, headers=headers)
 
     if session_cookie_response.status_code == 401:
         raise UnauthorizedApiCallException()
 
     session_cookie = session_cookie_response.headers.get('set-cookie')
-    cookie_expiry = datetime.utcnow() + timedelta(minutes=14)
-    cookie_expiry = calendar.timegm(cookie_expiry.utctimetuple())
+    cookie_expiry = int(time.time()) + 14 * 60
     token = {'expires_at': cookie_expiry, 'access_token': session_cookie}
     parent = ndb.Key('Org', user_creds.key.id())
-    OrgCredentials(parent=parent, id=user_creds.key.id(), token=token).put()
+    return OrgCredentials(parent=parent, id=user_creds.key.id(), token=token)
@@ -3,11 +3,18 @@ Flask app providing endpoints to execute steps of serial data sync. These are to
 """
 
 import logging
-from google.appengine.api import taskqueue
+from google.appengine.api import memcache, taskqueue
+from google.appengine.ext import ndb
 from flask import Flask, request, jsonify
 from app.utils import sync_utils
 from app.utils.auth import check_api_key, UnauthorizedError
-from app.utils.sync_utils import DisconnectException, RateLimitException, CONNECTED
+from app.utils.sync_utils import (
+    DisconnectException,
+    RateLimitException,
+    CONNECTED,
+    SYNCED_STATUS_CACHE_KEY,
+    SYNCED_STATUS_CACHE_TTL
+)
 from app.clients import client_factory
 from app.services.ndb_models import Org, OrgChangeset
 from app.services.middlewares import AppEngineMiddleware
@@ -28,7 +35,7 @@ def prefix(route):
     Returns:
         str: formatted route to work with dispatch.yaml
     """
-    return '/adapter{}'.format(route)
+    return '/adapter' + route
 
 
 @app.route(prefix('/<string:org_uid>/status'))
@@ -58,29 +65,46 @@ def status(org_uid):
 
         return date.isoformat() + 'Z'
 
-    org = Org.get_by_id(org_uid)
+    # the synced status is derived from the last published changeset, which only changes on publish, so it is cached
+    cache_key = SYNCED_STATUS_CACHE_KEY.format(org_uid)
+    synced_status = memcache.get(cache_key)
+
+    # the org and its last published changeset are fetched concurrently, only the ingestion completion time of the
+    # changeset is needed so it is a projection query
+    org_future = Org.get_by_id_async(org_uid)
+
+    if synced_status is None:
+        changeset_future = OrgChangeset.query(
+                OrgChangeset.org_uid == org_uid,
+                OrgChangeset.publish_job_finished == True,
+                OrgChangeset.publish_job_failed == False
+            ).order(
+                -OrgChangeset.publish_finished_at
+            ).fetch_async(1, projection=[OrgChangeset.ingestion_completed_at])
+
+    org = org_future.get_result()
 
     if not org:
-        logging.info("org {} not found".format(org_uid))
+        logging.info("org %s not found", org_uid)
         return '', 404
 
-    changeset = OrgChangeset.query(
-            OrgChangeset.org_uid == org_uid,
-            OrgChangeset.publish_job_finished == True,
-            OrgChangeset.publish_job_failed == False
-        ).order(
-            -OrgChangeset.publish_finished_at
-        ).fetch(1)
+    if synced_status is None:
+        changeset = changeset_future.get_result()
 
-    # first publish happens only when all the data is ingested, so if the first publish happened the org is synced
-    synced = False
-    if changeset:
-        synced = True
+        # first publish happens only when all the data is ingested, so if the first publish happened the org is synced
+        synced = False
+        if changeset:
+            synced = True
 
-    # synced_at is the ingestion completion time of the last changeset that got published
-    synced_at = None
-    if changeset:
-        synced_at = changeset[0].ingestion_completed_at
+        # synced_at is the ingestion completion time of the last changeset that got published
+        synced_at = None
+        if changeset:
+            synced_at = changeset[0].ingestion_completed_at
+
+        synced_status = (synced, synced_at)
+        memcache.set(cache_key, synced_status, time=SYNCED_STATUS_CACHE_TTL)
+
+    synced, synced_at = synced_status
 
     status_payload = {
         'synced': synced,
@@ -91,7 +115,7 @@ def status(org_uid):
         'id': org_uid
     }
 
-    logging.info("org status: {}".format(status_payload))
+    logging.info("org status: %s", status_payload)
 
     return jsonify(status_payload), 200
 
@@ -111,6 +135,7 @@ def init_all_updates():
 
 
 @app.route(prefix('/<string:org_uid>/init_update'), methods=['POST'])
+@ndb.toplevel
 def init_update(org_uid):
     """
     Endpoint that initiates data pull for a specific org.
@@ -123,12 +148,13 @@ def init_update(org_uid):
     Returns:
         (str, int): http response
     """
-    logging.info("initializing update cycle for org {}".format(org_uid))
+    logging.info("initializing update cycle for org %s", org_uid)
     sync_utils.init_update(org_uid)
     return '', 204
 
 
 @app.route(prefix('/<string:provider>/<string:org_uid>/update'), methods=['POST'])
+@ndb.toplevel
 def update(provider, org_uid):
     """
     The main update loop for org updates.
@@ -181,6 +207,7 @@ def update(provider, org_uid):
 
 
 @app.route(prefix('/<string:org_uid>/reconnect'), methods=['POST'])
+@ndb.toplevel
 def reconnect(org_uid):
     """
     Endpoint to facilitate long term org re-connection loop.
@@ -203,7 +230,7 @@ def reconnect(org_uid):
         logging.info("reached maximum number of reconnect attempts, giving up")
         return '', 204
 
-    logging.info("checking connection status (check number {})".format(exec_count))
+    logging.info("checking connection status (check number %s)", exec_count)
 
     try:
         if client_factory.get_api_session(org.provider, org_uid).is_authenticated():
@@ -211,8 +238,8 @@ def reconnect(org_uid):
             sync_utils.mark_as_connected(org_uid)
             sync_utils.init_update(org_uid)
             return '', 204
-    except DisconnectException as e:
-        logging.exception("failed reconnecting to client.", e)
+    except DisconnectException:
+        logging.exception("failed reconnecting to client.")
 
     logging.info("could not make a successful api call, leaving org as disconnected, will try again")
     return '', 423
@@ -22,6 +22,17 @@ from app.utils.task_utils import query_to_tasks
 app = Flask(__name__)
 app.secret_key = "super secret key"
 
+# keep every parsed template for the lifetime of the instance (must be set before jinja_env is first used)
+app.jinja_options = dict(Flask.jinja_options, cache_size=-1)
+
+TEMPLATES = [
+    'org_list.html',
+    'select_endpoints.html',
+    'select_item_types.html',
+    'changeset_list.html',
+    'commands.html'
+]
+
 
 START_OF_TIME = '1970-01-01T00:00:00'
 
@@ -36,7 +47,7 @@ def prefix(route):
     Returns:
         str: formatted route to work with dispatch.yaml
     """
-    return '/admin{}'.format(route)
+    return '/admin' + route
 
 
 def _get_changesets(orgs):
@@ -219,32 +230,34 @@ def reset_endpoints():
 
 
 @app.route(prefix('/reset_endpoints_task/<string:org_uid>'), methods=['POST'])
+@ndb.toplevel
 def reset_endpoints_task(org_uid):
     """
     Processes org reset task from the task queue (clears endpoint state to cause the next sync to fetch all the data,
     and creates a task on the update queue to kick of the sync cycle for the org).
     """
-    org = Org.get_by_id(org_uid)
+    # the org and its sync data are fetched in one batch
+    org, sync_data = ndb.get_multi([ndb.Key(Org, org_uid), ndb.Key(QboSyncData, org_uid)])
 
     if (org.changeset_started_at and not org.changeset_completed_at) or org.update_cycle_active:
         logging.info("org syncing at the moment, will try again later")
         return '', 423
 
     endpoint_indexes = request.form.getlist('endpoint_index')
-    logging.info("resetting markers for org {} and endpoints {}".format(org_uid, endpoint_indexes))
+    logging.info("resetting markers for org %s and endpoints %s", org_uid, endpoint_indexes)
 
     # TODO: this is a hack, this should be delegated to a qbo class, instantiated via a factory from the org provider
-    sync_data = QboSyncData.get_by_id(org_uid)
-
     if not sync_data:
         logging.warning("could not find sync data")
         return '', 204
 
-    for endpoint_index in [int(_index) for _index in endpoint_indexes]:
+    for endpoint_index in map(int, endpoint_indexes):
         sync_data.markers[endpoint_index] = START_OF_TIME
 
-    sync_data.put()
+    # the markers are written while the update cycle is being initialised
+    put_future = sync_data.put_async()
     sync_utils.init_update(org_uid)
+    put_future.get_result()
 
     return '', 204
 
@@ -282,9 +295,11 @@ def replay_item_types():
     if org_uid:
         job_params['orgs'] = org_uid
     else:
-        job_params['orgs'] = ','.join([key.string_id() for key in Org.query().fetch(keys_only=True)])
+        # only connected orgs are replayed, the same orgs the all org endpoint resets apply to
+        orgs = Org.query(Org.status == CONNECTED).iter(keys_only=True, batch_size=500)
+        job_params['orgs'] = ','.join(key.string_id() for key in orgs)
 
-    logging.info("starting dataflow template '{}' with params: {}".format(template_name, job_params))
+    logging.info("starting dataflow template '%s' with params: %s", template_name, job_params)
 
     try:
         flash(escape(str(start_template(template_name, '{} all that is good'.format(template_name), job_params))))
@@ -346,6 +361,7 @@ def changeset_list(org_uid):
 
 
 @app.route(prefix('/publish_per_org'), methods=['POST'])
+@ndb.toplevel
 def publish_per_org():
     """
     Handles a command to publish all changesets with a publish job per org.
@@ -370,3 +386,8 @@ def commands():
         (str, int): command listing page
     """
     return render_template('commands.html', endpoints=ENDPOINTS), 200
+
+
+# parse the templates when the instance starts rather than on the first request to each page
+for template in TEMPLATES:
+    app.jinja_env.get_template(template)
@@ -24,7 +24,7 @@ def prefix(route):
     Returns:
         str: formatted route to work with dispatch.yaml
     """
-    return '/api{}'.format(route)
+    return '/api' + route
 
 
 @app.route(prefix('/data_sources/<string:org_uid>/status'))
@@ -14,6 +14,10 @@ from app.services.ndb_models import ProviderConfig
 
 app = Flask(__name__)
 
+# urlfetch deadline (in seconds) for starting an export, the api only has to accept the export operation (which then
+# runs server side), so the request doesn't need to hold the instance for long
+EXPORT_API_CALL_TIMEOUT = 10
+
 
 @app.route('/cloud-datastore-export')
 def cloud_datastore_export():
@@ -52,17 +56,28 @@ def cloud_datastore_export():
 
     logging.info("making api call (entity_filter: {}, request_data: {})".format(entity_filter, request_data))
 
-    result = urlfetch.fetch(
-        url=url,
+    rpc = urlfetch.create_rpc(deadline=EXPORT_API_CALL_TIMEOUT)
+    urlfetch.make_fetch_call(
+        rpc,
+        url,
         payload=json.dumps(request_data),
         method=urlfetch.POST,
-        deadline=60,
         headers=headers
     )
 
+    try:
+        result = rpc.get_result()
+    except urlfetch.DeadlineExceededError:
+        # the export may or may not have started, so this is reported as a failure for cron to show and retry
+        logging.error("no response from the export api within {}s".format(EXPORT_API_CALL_TIMEOUT))
+        return '', 503
+
     logging.info("got response with status '{}' and contents '{}'".format(result.status_code, result.content))
 
-    job_state = json.loads(result.content).get('metadata', {}).get('common', {}).get('state')
+    try:
+        job_state = json.loads(result.content).get('metadata', {}).get('common', {}).get('state')
+    except ValueError:
+        job_state = None
 
     if result.status_code == 200 and job_state == "PROCESSING":
         logging.info("export started successfully")
@@ -4,7 +4,8 @@ Flask app providing endpoints for connection of GLs files via 2 legged auth such
 import json
 import logging
 import os
-from flask import Flask, request, redirect, jsonify, render_template
+from flask import Flask, request, redirect, jsonify
+from google.appengine.ext import ndb
 
 from app.clients import client_factory
 from app.utils.pubsub_utils import publish_status, LINK_STATUS_TYPE, LINK_STATUS_UNLINKED, LINK_STATUS_LINKED
@@ -15,7 +16,7 @@ from app.utils.sync_utils import (
     MismatchingFileConnectionAttempt,
     FailedToGetCompanyName,
     NotFoundException,
-    mark_as_connected,
+    mark_as_connected_async,
     mark_as_disconnected,
     init_update,
     create_manual_provider_org,
@@ -39,11 +40,12 @@ def prefix(route):
     Returns:
         str: formatted route to work with dispatch.yaml
     """
-    return '/linker{}'.format(route)
+    return '/linker' + route
 
 
 @app.route(prefix('/<string:provider>/<string:org_uid>/connect'), methods=['GET', 'POST'])
 @check_api_key
+@ndb.toplevel
 def connect(provider, org_uid):
     """
     The first endpoint to be invoked by a client wishing to connect a new data source. Redirects the client to the data
@@ -88,6 +90,21 @@ def connect(provider, org_uid):
     return '', 404
 
 
+@app.route('/_ah/warmup')
+def warmup():
+    """
+    Warmup request handler, reads all the provider configs so that they are in memcache for the first connect requests
+    served by a new instance.
+
+    Returns:
+        (str, int): http response
+    """
+    provider_configs = ndb.get_multi(ProviderConfig.query().fetch(keys_only=True))
+    logging.info("loaded {} provider configs".format(len(provider_configs)))
+
+    return '', 204
+
+
 @app.route(prefix('/<string:provider>/<string:org_uid>/disconnect'), methods=['POST'])
 @check_api_key
 def disconnect(provider, org_uid):
@@ -102,10 +119,11 @@ def disconnect(provider, org_uid):
 @app.route(prefix('/<string:provider>/<string:org_uid>/login'))
 def login(provider, org_uid):
     """Renders login page for the provider"""
-    return render_template('login.html', provider=provider, org_uid=org_uid), 200
+    return login_template.render(provider=provider, org_uid=org_uid), 200
 
 
 @app.route(prefix('/handle_login'), methods=['POST'])
+@ndb.toplevel
 def handle_login():
     """
     Processes form data from the app hosted login page
@@ -150,7 +168,8 @@ def basic_auth(provider, org_uid, username, password):
         _abort_link(org_uid)
         return _respond(Org.get_by_id(org_uid), {'error_code': 'invalid_credentials'}, 'not okidoki')
 
-    mark_as_connected(org_uid=org_uid, also_linked=True)
+    # the org is saved while the api session is prepared and the company name fetched, the update needs it saved
+    connected_future = mark_as_connected_async(org_uid=org_uid, also_linked=True)
 
     try:
         data_source_name = client_factory.get_api_session(provider, org_uid).get_company_name()
@@ -158,12 +177,14 @@ def basic_auth(provider, org_uid, username, password):
         # TODO: this should be sent to the client as an error code rather than an empty name
         data_source_name = None
 
+    connected_future.get_result()
     init_update(org_uid)
     return _respond(Org.get_by_id(org_uid), {'data_source_name': data_source_name}, 'okidoki')
 
 
 @app.route(prefix('/<string:org_uid>/oauth'))
 @app.route(prefix('/oauth'))
+@ndb.toplevel
 def oauth(org_uid=None):
     """
     Endpoint which handles the second step of the oAuth flow. This is where the data provider redirects the user to
@@ -197,7 +218,8 @@ def oauth(org_uid=None):
         _abort_link(org_uid)
         return _respond(exc.org, {'error_code': 'failed_to_get_identifier'}, 'not okidoki')
 
-    mark_as_connected(org_uid=org_uid, also_linked=True)
+    # the org is saved while the api session is prepared and the company name fetched, the update needs it saved
+    connected_future = mark_as_connected_async(org_uid=org_uid, also_linked=True)
 
     try:
         data_source_name = client_factory.get_api_session(provider, org_uid).get_company_name()
@@ -205,6 +227,7 @@ def oauth(org_uid=None):
         # TODO: this should be sent to the client as an error code rather than an empty name
         data_source_name = None
 
+    connected_future.get_result()
     init_update(org_uid)
     return _respond(session.org, {'data_source_name': data_source_name}, 'okidoki')
 
@@ -270,3 +293,8 @@ def _abort_link(org_uid):
 
     publish_status(org_uid, LINK_STATUS_TYPE, LINK_STATUS_UNLINKED)
     mark_as_disconnected(org_uid=org_uid, deactivate_update_cycle=False)
+
+
+# parse the login template when the instance starts, the page only needs the provider and org_uid so it is rendered
+# straight from the template without the flask template context
+login_template = app.jinja_env.get_template('login.html')
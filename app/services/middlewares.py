@@ -2,8 +2,13 @@
 Custom middlewares.
 """
 
+import threading
+
 from google.appengine.api import urlfetch
 
+# the urlfetch default deadline is thread-local, this records the deadline already set on each request thread
+_thread_local = threading.local()
+
 
 class AppEngineMiddleware:
     """
@@ -13,11 +18,16 @@ class AppEngineMiddleware:
     The default is 5 seconds, which is not sufficient in many cases. Be aware
     that App Engine has a strict 60 second request handling deadlines for
     user requests and 10 minutes for taskqueue requests.
+
+    The deadline is kept for the lifetime of the thread, so it is only set on the first request a thread serves (this
+    assumes nothing else changes the default deadline).
     """
     def __init__(self, app, urlfetch_deadline=15):
         self.app = app
         self.urlfetch_deadline = urlfetch_deadline
 
     def __call__(self, environ, start_response):
-        urlfetch.set_default_fetch_deadline(self.urlfetch_deadline)
+        if getattr(_thread_local, 'urlfetch_deadline', None) != self.urlfetch_deadline:
+            urlfetch.set_default_fetch_deadline(self.urlfetch_deadline)
+            _thread_local.urlfetch_deadline = self.urlfetch_deadline
         return self.app(environ, start_response)
@@ -75,6 +75,9 @@ class ProviderConfig(ndb.Model):
     """
     This class is intended to hold the provider configuration (partner keys etc) for an app family.
     """
+    # configs are read on every api session but edited out-of-band (which doesn't clear memcache), so cached copies
+    # expire after an hour
+    _memcache_timeout = 3600
     provider = ndb.StringProperty()
     app_family = ndb.StringProperty()
     client_id = ndb.StringProperty(indexed=False)
@@ -83,4 +86,10 @@ class ProviderConfig(ndb.Model):
 
     @staticmethod
     def find(provider, app_family):
-        return ProviderConfig.query(ProviderConfig.provider == provider, ProviderConfig.app_family == app_family).get()
\ No newline at end of file
+        # keys only, so that the config itself is read through the memcache tier
+        key = ProviderConfig.query(
+            ProviderConfig.provider == provider,
+            ProviderConfig.app_family == app_family
+        ).get(keys_only=True)
+
+        return key.get() if key else None
\ No newline at end of file
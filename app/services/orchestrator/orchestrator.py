@@ -3,29 +3,35 @@ Service responsible for orchestration of publishing jobs.
 """
 
 import logging
+from collections import defaultdict
 from datetime import datetime
-from itertools import groupby
-from operator import attrgetter
+from json import dumps, loads
+from google.appengine.api import memcache
 from google.appengine.ext import ndb
 from google.appengine.ext.ndb import Key
 from google.appengine.api.taskqueue import Task, Queue
 from flask import Flask, request
-from flask.json import dumps, loads
-from app.utils.dataflow_utils import start_template, get_job
+from app.utils.dataflow_utils import start_template, get_jobs
 from app.utils.pubsub_utils import (
     CHANGESET_STATUS_ERROR,
     CHANGESET_STATUS_SYNCED,
     CHANGESET_STATUS_SYNCING,
-    publish_changeset_status
+    publish_changeset_statuses
 )
 from app.utils.task_utils import items_to_tasks
-from app.utils.datastore_utils import emit_items
 from app.services.ndb_models import Org, OrgChangeset
+from app.utils.sync_utils import SYNCED_STATUS_CACHE_KEY
 
 
 FINAL_STATES = ['JOB_STATE_DONE', 'JOB_STATE_FAILED', 'JOB_STATE_CANCELLED', 'JOB_STATE_UPDATED', 'JOB_STATE_DRAINED']
 SUCCESS_STATE = 'JOB_STATE_DONE'
 
+# number of results per datastore round trip for the start_publish changeset queries
+QUERY_BATCH_SIZE = 500
+
+# maximum number of dataflow job statuses fetched in one batch request
+JOB_STATUS_BATCH_SIZE = 100
+
 
 app = Flask(__name__)
 
@@ -40,7 +46,7 @@ def prefix(route):
     Returns:
         str: formatted route to work with dispatch.yaml
     """
-    return '/orchestrator{}'.format(route)
+    return '/orchestrator' + route
 
 
 @app.route(prefix('/publish'), methods=['GET', 'POST'])
@@ -67,40 +73,56 @@ def start_publish():
     # - OR have been attempted to be published but failed
     #   - due to the whole job failing
     #   - OR publish of the individual changeset failing
-    org_changesets_query = OrgChangeset.query(
+    #
+    # unfinished changesets are either newly ingested or running (which gate publishing for their orgs), so one query
+    # gets both, and runs concurrently with the query for the failed ones
+    #
+    # only the org_uid, changeset and key of the changesets are used here, so projection queries avoid reading the
+    # whole entities (in large batches, as all the results are needed)
+    unfinished_org_changesets_future = OrgChangeset.query(
+        OrgChangeset.publish_job_finished == False
+    ).order(OrgChangeset.key).fetch_async(
+        projection=[OrgChangeset.org_uid, OrgChangeset.changeset, OrgChangeset.publish_job_running],
+        batch_size=QUERY_BATCH_SIZE
+    )
+
+    failed_org_changesets_future = OrgChangeset.query(
+        OrgChangeset.publish_job_running == False,
+        OrgChangeset.publish_job_finished == True,
         ndb.OR(
-            ndb.AND(
-                OrgChangeset.publish_job_running == False,
-                OrgChangeset.publish_job_finished == False
-            ),
-            ndb.AND(
-                OrgChangeset.publish_job_running == False,
-                OrgChangeset.publish_job_finished == True,
-                ndb.OR(
-                    OrgChangeset.publish_job_failed == True,
-                    OrgChangeset.publish_changeset_failed == True
-                )
-            )
+            OrgChangeset.publish_job_failed == True,
+            OrgChangeset.publish_changeset_failed == True
         )
-    ).order(OrgChangeset.key)
+    ).order(OrgChangeset.key).fetch_async(
+        projection=[OrgChangeset.org_uid, OrgChangeset.changeset],
+        batch_size=QUERY_BATCH_SIZE
+    )
 
-    org_changesets = list(emit_items(org_changesets_query))
+    # blacklisted orgs are few, so their keys are queried up-front instead of getting the org of every changeset
+    blacklisted_org_keys_future = Org.query(Org.publish_disabled == True).fetch_async(keys_only=True)
 
-    # Query any currently running org changesets
-    running_org_changesets_query = OrgChangeset.query(
-        OrgChangeset.publish_job_running == True
-    )
-    running_org_changesets = list(emit_items(running_org_changesets_query))
+    org_changesets = []
+    running_orgs = set()
+
+    for org_changeset in unfinished_org_changesets_future.get_result():
+        if org_changeset.publish_job_running:
+            running_orgs.add(org_changeset.org_uid)
+        else:
+            org_changesets.append(org_changeset)
 
-    running_orgs = list(set([running_org_changeset.org_uid for running_org_changeset in running_org_changesets]))
+    org_changesets.extend(failed_org_changesets_future.get_result())
 
     # Filter any org changesets that already have a running changeset for that org
-    gated_org_changesets = filter(lambda oc: oc.org_uid not in running_orgs, org_changesets)
+    gated_org_changesets = []
+    filtered_oc_tuples = []
 
-    if len(gated_org_changesets) != len(org_changesets):
-        filtered_ocs = filter(lambda oc: oc.org_uid in running_orgs, org_changesets)
-        filtered_oc_tuples = [(oc.org_uid, oc.changeset) for oc in filtered_ocs]
+    for org_changeset in org_changesets:
+        if org_changeset.org_uid in running_orgs:
+            filtered_oc_tuples.append((org_changeset.org_uid, org_changeset.changeset))
+        else:
+            gated_org_changesets.append(org_changeset)
 
+    if filtered_oc_tuples:
         logging.info("stopped these changesets from being published as job already running for the org: {}".format(
             filtered_oc_tuples
         ))
@@ -110,23 +132,20 @@ def start_publish():
         return '', 204
 
     # remove changesets for blacklisted orgs
-    blacklisted_orgs = {}
-    org_changesets_to_publish = []
-    for org_changeset in gated_org_changesets:
-        org = blacklisted_orgs.get(org_changeset.org_uid, Org.get_by_id(org_changeset.org_uid))
-        if org and org.publish_disabled:
-            blacklisted_orgs[org.key.string_id()] = org
-        else:
-            org_changesets_to_publish.append(org_changeset)
+    blacklisted_orgs = set([key.string_id() for key in blacklisted_org_keys_future.get_result()])
+    org_changesets_to_publish = [oc for oc in gated_org_changesets if oc.org_uid not in blacklisted_orgs]
 
     to_publish = []
 
     if per_org:
-        org_changesets_sorted = sorted(org_changesets_to_publish, key=attrgetter('org_uid'))
-        for org_uid, changesets in groupby(org_changesets_sorted, key=attrgetter('org_uid')):
+        org_changeset_ids = defaultdict(list)
+        for org_changeset in org_changesets_to_publish:
+            org_changeset_ids[org_changeset.org_uid].append(org_changeset.key.id())
+
+        for org_uid, ids in org_changeset_ids.items():
             to_publish.append({
                 'org_uid': org_uid,
-                'org_changeset_ids': [changeset.key.id() for changeset in changesets]
+                'org_changeset_ids': ids
             })
     else:
         to_publish.append({
@@ -167,7 +186,7 @@ def create_publish_job_task():
 
     org_changeset_ids = job_params.get('org_changeset_ids', [])
     org_changesets = ndb.get_multi([Key(OrgChangeset, _id) for _id in org_changeset_ids])
-    to_publish = ','.join(["{}:{}".format(row.org_uid, row.changeset) for row in org_changesets])
+    to_publish = ','.join('{}:{}'.format(row.org_uid, row.changeset) for row in org_changesets)
     job_params = {'orgChangesets': to_publish}
     logging.info("job params: {}".format(job_params))
 
@@ -180,7 +199,8 @@ def create_publish_job_task():
         for org_changeset in org_changesets:
             msg = "publishing error status for changeset {}:{} because dataflow job failed to be created"
             logging.info(msg.format(org_changeset.org_uid, org_changeset.changeset))
-            publish_changeset_status(org_changeset.org_uid, org_changeset.changeset, CHANGESET_STATUS_ERROR)
+
+        publish_changeset_statuses([(org_changeset, CHANGESET_STATUS_ERROR) for org_changeset in org_changesets])
 
         raise exc
 
@@ -197,11 +217,11 @@ def create_publish_job_task():
         org_changeset.publish_job_count += 1
         org_changeset.publish_started_at = now
 
-        # publish changeset status of syncing because this changeset could be in error and is being retried
-        publish_changeset_status(org_changeset.org_uid, org_changeset.changeset, CHANGESET_STATUS_SYNCING)
-
     ndb.put_multi(org_changesets)
 
+    # publish changeset status of syncing because these changesets could be in error and are being retried
+    publish_changeset_statuses([(org_changeset, CHANGESET_STATUS_SYNCING) for org_changeset in org_changesets])
+
     logging.info("job details saved in OrgChangeset")
 
     return '', 204
@@ -216,21 +236,16 @@ def update_changesets():
         (str, int): http response
     """
     now = datetime.utcnow()
-    statuses = {}
     org_changesets = OrgChangeset.query(OrgChangeset.publish_job_running == True).fetch()
 
     if not org_changesets:
         logging.info("no changesets to update")
         return '', 204
 
-    for org_changeset in org_changesets:
-        if org_changeset.publish_job_id not in statuses:
-            try:
-                statuses[org_changeset.publish_job_id] = get_job(org_changeset.publish_job_id)
-            except Exception:
-                logging.exception("failed to retrieve job status from dataflow api")
-                statuses[org_changeset.publish_job_id] = {'currentState': 'STATUS_API_CALL_FAILED'}
+    statuses = _get_job_statuses(list(set([org_changeset.publish_job_id for org_changeset in org_changesets])))
+    changeset_statuses = []
 
+    for org_changeset in org_changesets:
         job_status = statuses[org_changeset.publish_job_id]
         job_status = job_status.get('currentState', 'STATUS_API_RESPONSE_ERROR')
         org_changeset.publish_job_status = job_status
@@ -243,9 +258,9 @@ def update_changesets():
             org_changeset.publish_finished_at = now
 
             if job_status == SUCCESS_STATE:
-                publish_changeset_status(org_changeset.org_uid, org_changeset.changeset, CHANGESET_STATUS_SYNCED)
+                changeset_statuses.append((org_changeset, CHANGESET_STATUS_SYNCED))
             else:
-                publish_changeset_status(org_changeset.org_uid, org_changeset.changeset, CHANGESET_STATUS_ERROR)
+                changeset_statuses.append((org_changeset, CHANGESET_STATUS_ERROR))
 
         logging.info("updating org changeset ({}, {}) with job status {}".format(
             org_changeset.org_uid,
@@ -253,11 +268,52 @@ def update_changesets():
             org_changeset.publish_job_status
         ))
 
-        org_changeset.put()
+    ndb.put_multi(org_changesets)
+    publish_changeset_statuses(changeset_statuses)
+
+    # the synced status cached by the adapter status endpoint changes once a changeset is published
+    memcache.delete_multi([
+        SYNCED_STATUS_CACHE_KEY.format(org_changeset.org_uid)
+        for org_changeset in org_changesets
+        if org_changeset.publish_job_status == SUCCESS_STATE
+    ])
 
     return '', 204
 
 
+def _get_job_statuses(job_ids):
+    """
+    Fetches the details of dataflow jobs from the dataflow api, in batch requests of up to JOB_STATUS_BATCH_SIZE jobs.
+
+    Args:
+        job_ids(list): dataflow job ids
+
+    Returns:
+        dict: job details, keyed by the job id
+    """
+    statuses = {}
+
+    for start in range(0, len(job_ids), JOB_STATUS_BATCH_SIZE):
+        batch_job_ids = job_ids[start:start + JOB_STATUS_BATCH_SIZE]
+
+        try:
+            jobs = get_jobs(batch_job_ids)
+        except Exception:
+            logging.exception("failed to retrieve job statuses from dataflow api")
+            jobs = {}
+
+        for job_id in batch_job_ids:
+            job = jobs.get(job_id)
+
+            if job is None or isinstance(job, Exception):
+                logging.error("failed to retrieve job status from dataflow api: {}".format(job))
+                job = {'currentState': 'STATUS_API_CALL_FAILED'}
+
+            statuses[job_id] = job
+
+    return statuses
+
+
 @app.route(prefix('/clean_old_changeset_items'))
 def clean_historic_items():
 
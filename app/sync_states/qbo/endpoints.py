@@ -1,19 +1,34 @@
-ENDPOINTS = [
+# the sync goes through the endpoints in this order (by index), the other groups below are only used for membership
+# checks so they are sets
+ENDPOINTS = (
     'CompanyInfo', 'Preferences', 'Account', 'Customer', 'Vendor', 'Employee', 'TaxRate', 'TaxCode', 'Invoice',
     'Item', 'Deposit', 'CompanyCurrency', 'Payment', 'Bill', 'BillPayment', 'VendorCredit', 'CreditMemo'
-]
+)
 
-SKIP_PAGINATION = ['CompanyInfo', 'Preferences']
+SKIP_PAGINATION = frozenset(['CompanyInfo', 'Preferences'])
 
-SKIP_ID_IN_API_GET = ['CompanyInfo', 'Preferences']
+SKIP_ID_IN_API_GET = frozenset(['CompanyInfo', 'Preferences'])
 
-TRANSACTIONAL_ENDPOINTS = [
+TRANSACTIONAL_ENDPOINTS = frozenset([
     'Invoice', 'Deposit', 'Payment', 'Bill', 'BillPayment', 'VendorCredit', 'CreditMemo'
-]
+])
 
-HAS_ACTIVE_FLAG = [
+HAS_ACTIVE_FLAG = frozenset([
     'Account', 'Customer', 'Vendor', 'Employee', 'TaxRate', 'TaxCode', 'Item', 'CompanyCurrency'
-]
+])
+
+# the groups above as flags for each endpoint in ENDPOINTS, so the sync can check them by endpoint index
+IS_TRANSACTIONAL = tuple(endpoint in TRANSACTIONAL_ENDPOINTS for endpoint in ENDPOINTS)
+HAS_ACTIVE = tuple(endpoint in HAS_ACTIVE_FLAG for endpoint in ENDPOINTS)
+IS_PAGINATED = tuple(endpoint not in SKIP_PAGINATION for endpoint in ENDPOINTS)
+
+# endpoints which can be pulled through QBO's change data capture (cdc) api, which returns the changes to many entities
+# in one call
+CDC_ENDPOINTS = frozenset([
+    'Account', 'Customer', 'Vendor', 'Employee', 'Invoice', 'Item', 'Deposit', 'Payment', 'Bill', 'BillPayment',
+    'VendorCredit', 'CreditMemo'
+])
+CDC_ENDPOINT_INDEXES = tuple(index for index, endpoint in enumerate(ENDPOINTS) if endpoint in CDC_ENDPOINTS)
 
 # Below are the endpoints used to map ingested `Journal` report transaction types
 ENDPOINT_TYPE_INVOICE = 'Invoice'
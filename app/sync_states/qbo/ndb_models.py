@@ -8,3 +8,5 @@ class QboSyncData(ndb.Model):
     journal_dates = ndb.StringProperty(repeated=True)
     account_balance_initial_marker = ndb.StringProperty()
     account_balance_marker = ndb.StringProperty()
+    cdc_done = ndb.BooleanProperty(default=False)
+    cdc_endpoint_indexes = ndb.IntegerProperty(repeated=True)
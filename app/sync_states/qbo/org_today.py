@@ -254,6 +254,10 @@ COUNTRY_TO_TIMEZONE = {
     'ZW': 'Africa/Johannesburg',
 }
 
+# pytz timezones keyed by country code, built on first use as most instances only see a few countries (pytz returns
+# the same object for a timezone name, so countries sharing a timezone share the object)
+_country_timezones = {}
+
 
 def get_org_today(org):
     """
@@ -265,7 +269,25 @@ def get_org_today(org):
     Returns:
         date: org's today date
     """
-    org_timezone = COUNTRY_TO_TIMEZONE[org.country]
-    today = datetime.now(timezone(org_timezone)).date()
+    today = datetime.now(_get_country_timezone(org.country)).date()
 
     return today
+
+
+def _get_country_timezone(country):
+    """
+    Gets the pytz timezone for a country code, creating it on first use.
+
+    Args:
+        country(str): country code
+
+    Returns:
+        tzinfo: the timezone
+    """
+    tz = _country_timezones.get(country)
+
+    if tz is None:
+        tz = timezone(COUNTRY_TO_TIMEZONE[country])
+        _country_timezones[country] = tz
+
+    return tz
@@ -5,12 +5,15 @@ import logging
 import os
 from datetime import datetime, timedelta
 from itertools import groupby
+from dateutil import parser
+from dateutil.tz import tzutc
 from app.clients.qbo_client import QboApiSession
 from app.services.ndb_models import Org, Item, MissingItem
 from app.utils import sync_utils
 from app.sync_states.qbo.ndb_models import QboSyncData
 from app.sync_states.qbo.endpoints import (
-    ENDPOINTS, SKIP_PAGINATION, SKIP_ID_IN_API_GET, TRANSACTIONAL_ENDPOINTS, HAS_ACTIVE_FLAG, JOURNAL_TXN_TYPE_TO_ENDPOINT_MAP
+    ENDPOINTS, SKIP_ID_IN_API_GET, IS_TRANSACTIONAL, HAS_ACTIVE, IS_PAGINATED, JOURNAL_TXN_TYPE_TO_ENDPOINT_MAP,
+    CDC_ENDPOINTS, CDC_ENDPOINT_INDEXES
 )
 from app.sync_states.qbo.org_today import get_org_today
 
@@ -23,6 +26,33 @@ TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S+00:00'
 CREATED_AT_FIELD_NAME = 'CreateTime'
 UPDATED_AT_FIELD_NAME = 'LastUpdatedTime'
 
+# the cdc api returns at most this many changes per entity, and only looks back 30 days (a day is kept as a buffer)
+CDC_MAX_RESULTS = 1000
+CDC_MAX_LOOKBACK = timedelta(days=29)
+
+# queries sent in one call to the batch api (qbo accepts up to 30)
+BATCH_SIZE = 30
+
+# pages of a paginated endpoint pulled through the batch api after a full page, in one sync step (up to BATCH_SIZE)
+BATCH_PAGES = 7
+
+# values in one datastore IN filter (each value is a sub-query, and the datastore allows up to 30 of them)
+MAX_IN_VALUES = 30
+
+
+def _parse_timestamp(timestamp):
+    """
+    Parses a QBO timestamp, treating timestamps without an offset as UTC so that they can all be compared.
+
+    Args:
+        timestamp(str): the timestamp
+
+    Returns:
+        datetime: timezone aware datetime
+    """
+    parsed = parser.parse(timestamp)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=tzutc())
+
 
 class ListApiStage(object):
     """
@@ -31,6 +61,10 @@ class ListApiStage(object):
     Additionally, this class sets journal and account balance target dates based on updated transactional items (for
     example, it watches invoice transaction dates when pulling updated invoices, and then sets target journal and
     account balance dates for subsequent ingestion stages to pull those items based on).
+
+    When the endpoints supported by the cdc api which have been synced before were all synced recently, a sync cycle
+    starts with one cdc call which pulls the changes to all of them. The endpoints fully covered by it are then skipped
+    by the per endpoint queries.
     """
 
     def __init__(self, org_uid):
@@ -44,45 +78,46 @@ class ListApiStage(object):
         self.org = Org.get_by_id(org_uid)
         self.entity_id = self.org.entity_id
         self.api_url = "{}company/{}/query?minorversion={}".format(BASE_API_URI, self.entity_id, API_MINOR_VERSION)
+        self.batch_url = "{}company/{}/batch?minorversion={}".format(BASE_API_URI, self.entity_id, API_MINOR_VERSION)
         self.sync_data = QboSyncData.get_by_id(org_uid) or QboSyncData(id=org_uid, endpoint_index=0, start_position=1)
 
         if self.sync_data.endpoint_index == 0:
             logging.info("this is a start of a new changeset, starting to ingest all endpoints")
 
-    def _get_url(self):
+    def _get_query(self, start_position):
         """
-        Builds a URL to fetch data for current sync state.
+        Builds a query to fetch data for current sync state.
+
+        Args:
+            start_position(int): position of the first item of the page to be pulled
 
         Returns:
-            str: URL (including the query parameter) for the data to be pulled from
+            str: query for the data to be pulled
         """
-        endpoint = ENDPOINTS[self.sync_data.endpoint_index]
-        marker = self.sync_data.markers.get(self.sync_data.endpoint_index, START_OF_TIME)
+        endpoint_index = self.sync_data.endpoint_index
+        endpoint = ENDPOINTS[endpoint_index]
+        marker = self.sync_data.markers.get(endpoint_index, START_OF_TIME)
 
         query_template = "select * from {} where MetaData.LastUpdatedTime > '{}' "
 
-        if endpoint in HAS_ACTIVE_FLAG:
+        if HAS_ACTIVE[endpoint_index]:
             query_template = query_template + "and Active in (true, false) "
 
         query_template = query_template + "order by MetaData.LastUpdatedTime asc startposition {} maxresults {}"
 
-        query = query_template.format(endpoint, marker, self.sync_data.start_position, PAGE_SIZE)
-        url = self.api_url + '&query=' + query
-        return url
+        return query_template.format(endpoint, marker, start_position, PAGE_SIZE)
 
-    @staticmethod
-    def _get_transaction_date(endpoint, item):
+    def _get_url(self, start_position):
         """
-        Extracts transaction date from an item (returns None if the item is not transactional).
+        Builds a URL to fetch data for current sync state.
 
         Args:
-            item(dict): raw item from an API endpoint
+            start_position(int): position of the first item of the page to be pulled
 
         Returns:
-            std, None: transaction date
+            str: URL (including the query parameter) for the data to be pulled from
         """
-        if endpoint in TRANSACTIONAL_ENDPOINTS:
-            return item['TxnDate']
+        return self.api_url + '&query=' + self._get_query(start_position)
 
     def is_new_company_info(self, company_info):
         """
@@ -107,34 +142,113 @@ class ListApiStage(object):
 
         return True
 
-    def next(self, payload):
+    def _get_page(self, session, endpoint, start_position):
         """
-        Pulls data from QBO API for the current sync step, stores the data into the endpoint cache, and stores the
-        updated sync state ready for the next sync step.
+        Pulls one page of items for the current endpoint.
 
         Args:
-            payload(dict): a payload which has been given to the adaptor last time this function ran
+            session(QboApiSession): api session for the org
+            endpoint(str): the current endpoint
+            start_position(int): position of the first item of the page
 
         Returns:
-            (bool, dict): a flag indicating if the sync has finished, and a payload to be passed in on next call
+            list: raw items of the page
         """
-        new_payload = {}
-        max_updated_at = None
+        response = session.get(self._get_url(start_position), headers={'Accept': 'application/json'})
+        return response.get('QueryResponse', {}).get(endpoint, [])
 
-        endpoint = ENDPOINTS[self.sync_data.endpoint_index]
-        logging.info("calling api for {}, endpoint {}".format(self.org_uid, endpoint))
+    def _get_next_pages(self, session, endpoint, start_position):
+        """
+        Pulls up to BATCH_PAGES pages following a full page with one call to the batch api. Only the pages up to the
+        first short page are kept, so the items stay in order and the following sync step carries on from where they
+        end. A fault on any of the kept pages fails the whole step so that it is retried.
 
-        session = QboApiSession(self.org_uid)
-        response = session.get(self._get_url(), headers={'Accept': 'application/json'})
+        Args:
+            session(QboApiSession): api session for the org
+            endpoint(str): the current endpoint
+            start_position(int): position of the first item of the first page to be pulled
 
-        items = response.get('QueryResponse', {}).get(endpoint, [])
-        logging.info("got {} items for endpoint {}".format(len(items), endpoint))
+        Returns:
+            (list, bool): raw items of the kept pages, and a flag indicating if there could be more pages
+        """
+        response = session.post(
+            self.batch_url,
+            json={
+                'BatchItemRequest': [
+                    {'bId': str(page), 'Query': self._get_query(start_position + page * PAGE_SIZE)}
+                    for page in range(BATCH_PAGES)
+                ]
+            },
+            headers={'Accept': 'application/json'}
+        )
+        batch_responses = {
+            batch_response.get('bId'): batch_response
+            for batch_response in response.get('BatchItemResponse', [])
+        }
 
-        if items:
-            max_updated_at = items[-1]['MetaData']['LastUpdatedTime']
+        items = []
+        for page in range(BATCH_PAGES):
+            batch_response = batch_responses.get(str(page))
 
+            if batch_response is None or 'Fault' in batch_response:
+                message = "batch api call failed: url - {}, data - {}"
+                raise ValueError(message.format(self.batch_url, batch_response))
+
+            page_items = batch_response.get('QueryResponse', {}).get(endpoint, [])
+            items.extend(page_items)
+
+            if len(page_items) < PAGE_SIZE:
+                return items, False
+
+        return items, True
+
+    def _get_cdc_endpoints(self):
+        """
+        Works out which cdc endpoints can be pulled through the cdc api, and the time from which their changes are
+        pulled (the oldest of their markers). Endpoints which haven't been synced yet (or have never had any items) are
+        left to the per endpoint queries.
+
+        Returns:
+            (list, str|None): indexes of the endpoints to pull through the cdc api, and the oldest of their markers (no
+                endpoints if none have been synced or the oldest marker is too old for the cdc api)
+        """
+        endpoint_indexes = [
+            index for index in CDC_ENDPOINT_INDEXES
+            if self.sync_data.markers.get(index, START_OF_TIME) != START_OF_TIME
+        ]
+
+        if not endpoint_indexes:
+            return [], None
+
+        markers = [self.sync_data.markers[index] for index in endpoint_indexes]
+        parsed_markers = [_parse_timestamp(marker) for marker in markers]
+
+        oldest_marker = min(parsed_markers)
+        if datetime.now(tzutc()) - oldest_marker > CDC_MAX_LOOKBACK:
+            return [], None
+
+        return endpoint_indexes, markers[parsed_markers.index(oldest_marker)]
+
+    def _create_items(self, endpoint_index, items):
+        """
+        Creates the Item objects for items pulled from an endpoint, and collects the transaction dates of
+        transactional items for the journal and account balance stages.
+
+        Args:
+            endpoint_index(int): index of the endpoint the items are from
+            items(list): raw items from the endpoint
+
+        Returns:
+            list(ndb.Model): a list of Item instances ready to be saved
+        """
+        endpoint = ENDPOINTS[endpoint_index]
+        is_transactional = IS_TRANSACTIONAL[endpoint_index]
+        journal_dates = set(self.sync_data.journal_dates)
         item_objects = []
 
+        # CompanyInfo endpoint ignores LastUpdatedTime filter, we have to manually de-duplicate
+        is_new = bool(items) and (endpoint != 'CompanyInfo' or self.is_new_company_info(items[0]))
+
         for item in items:
 
             # grab the country as we need it to work out org's today
@@ -142,12 +256,11 @@ class ListApiStage(object):
                 self.org.country = item['Country']
                 self.org.put()
 
-            # CompanyInfo endpoint ignores LastUpdatedTime filter, we have to manually de-duplicate
-            if endpoint != 'CompanyInfo' or self.is_new_company_info(items[0]):
-                journal_date = self._get_transaction_date(endpoint, item)
+            if is_new:
+                # transaction date of transactional items
+                journal_date = item['TxnDate'] if is_transactional else None
                 if journal_date:
-                    dates = set(self.sync_data.journal_dates + [journal_date])
-                    self.sync_data.journal_dates = dates
+                    journal_dates.add(journal_date)
 
                 item_objects.extend(
                     sync_utils.create_items(
@@ -160,11 +273,132 @@ class ListApiStage(object):
                     )
                 )
 
+        if len(journal_dates) != len(self.sync_data.journal_dates):
+            self.sync_data.journal_dates = sorted(journal_dates)
+
+        return item_objects
+
+    def _next_cdc(self, endpoint_indexes, changed_since):
+        """
+        Pulls the changes to the given cdc endpoints since the given time with one cdc api call. Endpoints which hit the
+        cdc result limit are left to the per endpoint queries (which page through them), the others get their items
+        saved and markers moved on, and are skipped for the rest of the sync cycle.
+
+        Args:
+            endpoint_indexes(list): indexes of the endpoints to pull
+            changed_since(str): the time from which changes are pulled
+
+        Returns:
+            (bool, dict): a flag indicating if the sync has finished, and a payload to be passed in on next call
+        """
+        logging.info("calling cdc api for {}, changed since {}".format(self.org_uid, changed_since))
+
+        session = QboApiSession(self.org_uid)
+        response = session.get(
+            "{}company/{}/cdc".format(BASE_API_URI, self.entity_id),
+            params={
+                'entities': ','.join(ENDPOINTS[index] for index in endpoint_indexes),
+                'changedSince': changed_since,
+                'minorversion': API_MINOR_VERSION
+            },
+            headers={'Accept': 'application/json'}
+        )
+
+        cdc_responses = response.get('CDCResponse') or [{}]
+
+        endpoint_items = {}
+        for query_response in cdc_responses[0].get('QueryResponse', []):
+            for endpoint, items in query_response.iteritems():
+                if endpoint in CDC_ENDPOINTS:
+                    endpoint_items[endpoint] = items
+
+        item_objects = []
+        cdc_endpoint_indexes = []
+
+        for endpoint_index in endpoint_indexes:
+            endpoint = ENDPOINTS[endpoint_index]
+            items = endpoint_items.get(endpoint, [])
+
+            if len(items) >= CDC_MAX_RESULTS:
+                logging.info("cdc returned the item limit for {}, leaving it to the query".format(endpoint))
+                continue
+
+            logging.info("got {} items for endpoint {} from cdc".format(len(items), endpoint))
+
+            # changedSince is the oldest marker, so items which this endpoint's own marker has already covered are
+            # dropped (like the queries' LastUpdatedTime filter does). deleted entities are not ingested by the queries
+            # either.
+            current_marker = _parse_timestamp(self.sync_data.markers[endpoint_index])
+            items = [
+                item for item in items
+                if item.get('status') != 'Deleted'
+                and _parse_timestamp(item['MetaData']['LastUpdatedTime']) > current_marker
+            ]
+            item_objects.extend(self._create_items(endpoint_index, items))
+
+            if items:
+                marker = max((item['MetaData']['LastUpdatedTime'] for item in items), key=_parse_timestamp)
+                logging.info("setting updated_at marker for {} to {}".format(endpoint, marker))
+                self.sync_data.markers[endpoint_index] = marker
+
+            cdc_endpoint_indexes.append(endpoint_index)
+
         sync_utils.save_items(item_objects)
 
-        is_paginated = endpoint not in SKIP_PAGINATION
+        self.sync_data.cdc_endpoint_indexes = cdc_endpoint_indexes
+        self.sync_data.put()
+
+        return False, {}
+
+    def next(self, payload):
+        """
+        Pulls data from QBO API for the current sync step, stores the data into the endpoint cache, and stores the
+        updated sync state ready for the next sync step.
+
+        Args:
+            payload(dict): a payload which has been given to the adaptor last time this function ran
+
+        Returns:
+            (bool, dict): a flag indicating if the sync has finished, and a payload to be passed in on next call
+        """
+        new_payload = {}
+        max_updated_at = None
+
+        # the cdc api is tried once at the start of each sync cycle
+        if self.sync_data.endpoint_index == 0 and not self.sync_data.cdc_done:
+            self.sync_data.cdc_done = True
+            cdc_endpoint_indexes, changed_since = self._get_cdc_endpoints()
+            if cdc_endpoint_indexes:
+                return self._next_cdc(cdc_endpoint_indexes, changed_since)
+
+        endpoint_index = self.sync_data.endpoint_index
+        endpoint = ENDPOINTS[endpoint_index]
+        logging.info("calling api for {}, endpoint {}".format(self.org_uid, endpoint))
+
+        session = QboApiSession(self.org_uid)
+        items = self._get_page(session, endpoint, self.sync_data.start_position)
+
+        is_paginated = IS_PAGINATED[endpoint_index]
         has_more_items = len(items) == PAGE_SIZE
 
+        # the first page is pulled on its own, the following ones are only worth pulling if it was full
+        if is_paginated and has_more_items:
+            next_items, has_more_items = self._get_next_pages(
+                session,
+                endpoint,
+                self.sync_data.start_position + PAGE_SIZE
+            )
+            items.extend(next_items)
+
+        logging.info("got {} items for endpoint {}".format(len(items), endpoint))
+
+        if items:
+            max_updated_at = items[-1]['MetaData']['LastUpdatedTime']
+
+        item_objects = self._create_items(endpoint_index, items)
+
+        sync_utils.save_items(item_objects)
+
         if is_paginated and has_more_items:
             logging.info("{} is a paginated endpoint and there could be more pages".format(endpoint))
             self.sync_data.start_position = self.sync_data.start_position + len(items)
@@ -174,13 +408,19 @@ class ListApiStage(object):
             marker = max_updated_at or payload.get('max_updated_at')
             if marker:
                 logging.info("setting updated_at marker for {} to {}".format(endpoint, marker))
-                self.sync_data.markers[self.sync_data.endpoint_index] = marker
+                self.sync_data.markers[endpoint_index] = marker
             self.sync_data.endpoint_index += 1
             self.sync_data.start_position = 1
 
+            # skip the endpoints which have already been pulled through the cdc api in this cycle
+            while self.sync_data.endpoint_index in self.sync_data.cdc_endpoint_indexes:
+                self.sync_data.endpoint_index += 1
+
         complete = self.sync_data.endpoint_index == len(ENDPOINTS)
         if complete:
             self.sync_data.endpoint_index = 0
+            self.sync_data.cdc_done = False
+            self.sync_data.cdc_endpoint_indexes = []
 
         self.sync_data.put()
         complete = complete and not has_more_items
@@ -215,6 +455,58 @@ class MissingItemsStage(object):
         self.org = Org.get_by_id(org_uid)
         self.entity_id = self.org.entity_id
         self.api_url = "{}company/{}/query?minorversion={}".format(BASE_API_URI, self.entity_id, API_MINOR_VERSION)
+        self.batch_url = "{}company/{}/batch?minorversion={}".format(BASE_API_URI, self.entity_id, API_MINOR_VERSION)
+
+    @staticmethod
+    def _get_query(endpoint, item_id):
+        """
+        Builds a query to fetch an item. Handles both queries with an ID and without (some endpoints like CompanyInfo do
+        not work with ID).
+
+        Returns:
+            str: the query
+        """
+        if item_id:
+            return "select * from {} where Id = '{}'".format(endpoint, item_id)
+
+        return "select * from {}".format(endpoint)
+
+    def _get_cached_items(self, missing_items):
+        """
+        Looks up missing items in the raw endpoint cache with one query per endpoint (per MAX_IN_VALUES ids), run
+        concurrently, instead of a query per item.
+
+        Args:
+            missing_items(list): missing items as stored in MissingItem
+
+        Returns:
+            dict: cached Item instances, keyed by (endpoint, item id), or by (endpoint, None) for endpoints which do not
+                have an ID (CompanyInfo for example)
+        """
+        item_ids = {}
+        for item in missing_items:
+            ids = item_ids.setdefault(item['type'], [])
+            if item['type'] not in SKIP_ID_IN_API_GET:
+                ids.append(item['id'])
+
+        futures = []
+        for endpoint, ids in item_ids.iteritems():
+            query = Item.query(Item.org_uid == self.org_uid, Item.endpoint == endpoint, Item.changeset == -1)
+
+            if endpoint in SKIP_ID_IN_API_GET:
+                futures.append(query.fetch_async(1))
+                continue
+
+            for start in range(0, len(ids), MAX_IN_VALUES):
+                futures.append(query.filter(Item.item_id.IN(ids[start:start + MAX_IN_VALUES])).fetch_async())
+
+        cached_items = {}
+        for future in futures:
+            for item_cache in future.get_result():
+                item_id = None if item_cache.endpoint in SKIP_ID_IN_API_GET else item_cache.item_id
+                cached_items[(item_cache.endpoint, item_id)] = item_cache
+
+        return cached_items
 
     def _get_url(self, endpoint, item_id):
         """
@@ -224,13 +516,7 @@ class MissingItemsStage(object):
         Returns:
             str: URL for the data to be pulled from
         """
-        if item_id:
-            query = "select * from {} where Id = '{}'".format(endpoint, item_id)
-        else:
-            query = "select * from {}".format(endpoint)
-
-        url = self.api_url + '&query=' + query
-        return url
+        return self.api_url + '&query=' + self._get_query(endpoint, item_id)
 
     def next(self, payload):
         """
@@ -244,57 +530,101 @@ class MissingItemsStage(object):
             (bool, dict): a flag indicating if the sync has finished, and a payload to be passed in on next call
         """
         results = []
+        api_items = []
+        session = None
         missing_item = MissingItem.query(MissingItem.org_uid == self.org_uid).get()
 
         if not missing_item:
             logging.info("no missing items, nothing to process")
             return True, {}
 
+        def not_found(item):
+            message_template = (
+                "could not find {} with id {} in the api either, "
+                "ignoring and deleting this missing item record"
+            )
+            logging.warning(message_template.format(item['type'], item.get('id')))
+            missing_item.key.delete()
+            return False, {}
+
+        cached_items = self._get_cached_items(missing_item.missing_items)
+
         for item in missing_item.missing_items:
             logging.info("processing missing item: {}".format(item))
 
             # handle items which do not have an ID (CompanyInfo for example)
             if item['type'] in SKIP_ID_IN_API_GET:
-                item_cache = Item.query(
-                    Item.org_uid == self.org_uid,
-                    Item.endpoint == item['type'],
-                    Item.changeset == -1
-                ).get()
+                item_cache = cached_items.get((item['type'], None))
             else:
-                item_cache = Item.query(
-                    Item.org_uid == self.org_uid,
-                    Item.endpoint == item['type'],
-                    Item.item_id == item['id'],
-                    Item.changeset == -1
-                ).get()
+                item_cache = cached_items.get((item['type'], item['id']))
 
             if item_cache:
-                data = item_cache.data
-                item_id = item_cache.item_id
-            else:
-                logging.info("could not find {} with id {} in raw endpoint cache".format(item['type'], item.get('id')))
-                session = QboApiSession(self.org_uid)
-                data = session.get(self._get_url(item['type'], item.get('id')), headers={'Accept': 'application/json'})
-                data = data.get('QueryResponse', {}).get(item['type'], {})
-
-                if data:
-                    data = data[0]
-                    item_id = data['Id']
-                else:
-                    message_template = (
-                        "could not find {} with id {} in the api either, "
-                        "ignoring and deleting this missing item record"
-                    )
-                    logging.warning(message_template.format(item['type'], item.get('id')))
-                    missing_item.key.delete()
-                    return False, {}
+                results.append({
+                    'endpoint': item['type'],
+                    'item_id': item_cache.item_id,
+                    'data': item_cache.data
+                })
+                continue
+
+            logging.info("could not find {} with id {} in raw endpoint cache".format(item['type'], item.get('id')))
+            session = session or QboApiSession(self.org_uid)
+
+            # items looked up by ID are collected and pulled through the batch api below
+            if item.get('id') and item['type'] not in SKIP_ID_IN_API_GET:
+                api_items.append(item)
+                continue
+
+            data = session.get(self._get_url(item['type'], item.get('id')), headers={'Accept': 'application/json'})
+            data = data.get('QueryResponse', {}).get(item['type'], {})
+
+            if not data:
+                return not_found(item)
 
             results.append({
                 'endpoint': item['type'],
-                'item_id': item_id,
-                'data': data
+                'item_id': data[0]['Id'],
+                'data': data[0]
             })
 
+        for start in range(0, len(api_items), BATCH_SIZE):
+            batch = api_items[start:start + BATCH_SIZE]
+            logging.info("calling batch api for {} missing items".format(len(batch)))
+
+            response = session.post(
+                self.batch_url,
+                json={
+                    'BatchItemRequest': [
+                        {'bId': str(index), 'Query': self._get_query(item['type'], item['id'])}
+                        for index, item in enumerate(batch)
+                    ]
+                },
+                headers={'Accept': 'application/json'}
+            )
+            batch_responses = {
+                batch_response.get('bId'): batch_response
+                for batch_response in response.get('BatchItemResponse', [])
+            }
+
+            for index, item in enumerate(batch):
+                batch_response = batch_responses.get(str(index))
+
+                # a fault is not the same as the item not being found, the step should be retried rather than the
+                # missing item being deleted
+                if batch_response is None or 'Fault' in batch_response:
+                    message = "batch api call failed: url - {}, data - {}"
+                    raise ValueError(message.format(self.batch_url, batch_response))
+
+                data = batch_response.get('QueryResponse', {}).get(item['type'])
+
+                if not data:
+                    return not_found(item)
+
+                results.append({
+                    'endpoint': item['type'],
+                    'item_id': data[0]['Id'],
+                    'data': data[0]
+                })
+
         item_objects = []
 
         for result in results:
@@ -363,11 +693,14 @@ class JournalReportStage(object):
             group these resulting objects and create an actual journal (just the lines need to be concatenated).
             """
 
+            transaction = journal_line[1]
+            transaction_type = transaction['value']
+
             return {
                 'group': {
-                    'Id': "{}{}".format(JOURNAL_TXN_TYPE_TO_ENDPOINT_MAP[journal_line[1]['value']], journal_line[1]['id']),
-                    'TransactionType': journal_line[1]['value'],
-                    'TransactionId': journal_line[1]['id'],
+                    'Id': "{}{}".format(JOURNAL_TXN_TYPE_TO_ENDPOINT_MAP[transaction_type], transaction['id']),
+                    'TransactionType': transaction_type,
+                    'TransactionId': transaction['id'],
                     'Date': journal_line[0]['value']
                 },
                 'Line': {
@@ -378,54 +711,42 @@ class JournalReportStage(object):
                 }
             }
 
-        def extract_lines(section, parent_section_account=None):
-            """
-            Extracts journal lines from the General Ledger report. This is recursive function as the journal lines
-            appear nested under a variable number of accounts. The account is carried through the recursive calls as it
-            can only be obtained from the parent section of the report (rather than the same section in which the lines
-            appear.
-
-            Args:
-                section(list|dict): a section of the report, could be a header or a list of lines
-                parent_section_account(str): the account for which the lines are for (if the section contains lines)
-
-            Returns:
-                list: a list of journal lines which could be deeply nested
+        def extract_lines(report):
             """
-            if isinstance(section, list):
-                return [extract_lines(subsection, parent_section_account) for subsection in section]
-            elif isinstance(section, dict):
-                if 'ColData' in section:
-                    section_data = section['ColData']
-                    if 'id' in section_data[1]:
-                        return add_journal_info(section_data, parent_section_account)
-                section_account = section.get('Header', {}).get('ColData')
-                if section_account:
-                    section_account = {
-                        'AccountId': section_account[0].get('id'),
-                        'AccountName': section_account[0].get('value')
-                    }
-                else:
-                    section_account = None
-                return [
-                    extract_lines(subsection, section_account or parent_section_account)
-                    for _, subsection in section.iteritems()
-                ]
-
-        def flatten(list_to_flatten):
-            """
-            Flattens a deeply nested list of objects ([x, [x, [x, x]]] -> [x, x, x, x])
+            Extracts journal lines from the General Ledger report. The journal lines appear nested under a variable
+            number of accounts, so the report is walked with an explicit stack of (section, account) pairs rather than
+            recursively. The account is carried with each section as it can only be obtained from the parent section of
+            the report (rather than the same section in which the lines appear).
 
             Args:
-                list_to_flatten(list): the list to be flattened
+                report(dict): the General Ledger report
 
-            Returns:
-                list: a flat list
+            Yields:
+                dict: journal lines, with the journal properties added by add_journal_info
             """
-            if isinstance(list_to_flatten, list):
-                return [sub_item for item in list_to_flatten for sub_item in flatten(item)]
-            else:
-                return [list_to_flatten]
+            stack = [(report, None)]
+
+            while stack:
+                section, parent_section_account = stack.pop()
+
+                if isinstance(section, list):
+                    stack.extend((subsection, parent_section_account) for subsection in reversed(section))
+                elif isinstance(section, dict):
+                    if 'ColData' in section:
+                        section_data = section['ColData']
+                        if 'id' in section_data[1]:
+                            yield add_journal_info(section_data, parent_section_account)
+                            continue
+                    section_account = section.get('Header', {}).get('ColData')
+                    if section_account:
+                        section_account = {
+                            'AccountId': section_account[0].get('id'),
+                            'AccountName': section_account[0].get('value')
+                        }
+                    else:
+                        section_account = None
+                    account = section_account or parent_section_account
+                    stack.extend((subsection, account) for subsection in section.itervalues())
 
         if not self.sync_data.journal_dates:
             return True, {}
@@ -438,10 +759,7 @@ class JournalReportStage(object):
         session = QboApiSession(self.org_uid)
         response = session.get(self._get_url(report_date))
 
-        report_items = flatten(extract_lines(response))
-
-        report_items = [report_item for report_item in report_items if report_item]
-        report_items = sorted(report_items, key=lambda x: x['group']['Id'])
+        report_items = sorted(extract_lines(response), key=lambda x: x['group']['Id'])
         logging.info("have {} journal lines in total to save".format(len(report_items)))
 
         item_objects = []
@@ -450,8 +768,10 @@ class JournalReportStage(object):
         # properties have been created by add_journal_info function and are under the 'group' key). we then concatenate
         # all the lines for the particular group and we get a journal ('group' will have journal properties, the
         # concatenated lines will be all the lines for the journal).
-        for journal, lines in groupby(report_items, lambda x: x['group']):
-            journal['Lines'] = [line['Line'] for line in lines]
+        for _, lines in groupby(report_items, lambda x: x['group']['Id']):
+            first_line = next(lines)
+            journal = first_line['group']
+            journal['Lines'] = [first_line['Line']] + [line['Line'] for line in lines]
 
             # synthesise created_at and updated_at fields for the journal
             # we have to 'make up' these values because qbo doesn't have journals. we could look up Item with changeset
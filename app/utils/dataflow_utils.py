@@ -70,10 +70,37 @@ def start_template(filename, job_name, params={}, retries=5):
             raise ex
 
 
-def get_job(job_id):
-    request = get_client().projects().locations().jobs().get(
+def _get_job_request(job_id):
+    return get_client().projects().locations().jobs().get(
         projectId=app_identity.get_application_id(),
         jobId=job_id,
         location=os.environ.get('DATAFLOW_REGION') or 'us-central1'
     )
-    return request.execute()
+
+
+def get_job(job_id):
+    return _get_job_request(job_id).execute()
+
+
+def get_jobs(job_ids):
+    """
+    Gets the details of several jobs with one batch request to the dataflow api (the api client is not thread-safe, so
+    the calls can't be overlapped from threads).
+
+    Args:
+        job_ids (list): The job ids.
+
+    Returns:
+        dict: The job details, or the exception raised for a job which could not be retrieved, keyed by the job id.
+    """
+    jobs = {}
+
+    def callback(request_id, response, exception):
+        jobs[job_ids[int(request_id)]] = exception or response
+
+    batch = get_client().new_batch_http_request(callback=callback)
+    for index, job_id in enumerate(job_ids):
+        batch.add(_get_job_request(job_id), request_id=str(index))
+
+    batch.execute()
+    return jobs
@@ -98,6 +98,47 @@ def publish_changeset_status(org_uid, changeset, status_value):
     """
     topic = get_client().topic(STATUS_TOPIC)
 
+    synced_at = None
+    if status_value == CHANGESET_STATUS_SYNCED:
+        org_changeset = OrgChangeset.query(OrgChangeset.org_uid == org_uid, OrgChangeset.changeset == changeset).get()
+        synced_at = org_changeset.publish_finished_at
+
+    topic.publish(_changeset_status_message(org_uid, changeset, status_value, synced_at))
+
+
+def publish_changeset_statuses(statuses):
+    """
+    Utility function for publishing the status events of several org changesets on pubsub in one request.
+
+    Args:
+        statuses(list): (OrgChangeset, status) tuples, the status being one of syncing, synced or error
+    """
+    if not statuses:
+        return
+
+    topic = get_client().topic(STATUS_TOPIC)
+
+    with topic.batch() as batch:
+        for org_changeset, status_value in statuses:
+            synced_at = org_changeset.publish_finished_at if status_value == CHANGESET_STATUS_SYNCED else None
+            batch.publish(
+                _changeset_status_message(org_changeset.org_uid, org_changeset.changeset, status_value, synced_at)
+            )
+
+
+def _changeset_status_message(org_uid, changeset, status_value, synced_at):
+    """
+    Builds the pubsub message for an org changeset status event.
+
+    Args:
+        org_uid(str): org identifier
+        changeset(int): update cycle identifier
+        status_value(str): status (eg. syncing, synced, error)
+        synced_at(datetime): publish completion time of a synced changeset, None for other statuses
+
+    Returns:
+        str: the message
+    """
     payload = {
         "meta": {
             "version": "2.0.0",
@@ -117,12 +158,9 @@ def publish_changeset_status(org_uid, changeset, status_value):
         ]
     }
 
-    attributes = payload['data'][0]['attributes']
-
-    if status_value == CHANGESET_STATUS_SYNCED:
-        org_changeset = OrgChangeset.query(OrgChangeset.org_uid == org_uid, OrgChangeset.changeset == changeset).get()
-        attributes['synced_at'] = org_changeset.publish_finished_at.replace(microsecond=0).isoformat()
+    if synced_at:
+        payload['data'][0]['attributes']['synced_at'] = synced_at.replace(microsecond=0).isoformat()
 
     logging.info("publishing on status pubsub topic: {}".format(payload))
 
-    topic.publish(json.dumps(payload))
+    return json.dumps(payload)
@@ -31,6 +31,11 @@ DISCONNECTED = 3
 
 SYNC_INTERVAL = timedelta(minutes=60)
 
+# memcache key (formatted with the org_uid) and expiry (in seconds) of the (synced, synced_at) status of an org, the key
+# is deleted when a changeset of the org is published
+SYNCED_STATUS_CACHE_KEY = 'synced_status:{}'
+SYNCED_STATUS_CACHE_TTL = 30
+
 
 class RateLimitException(Exception):
     """
@@ -408,6 +413,22 @@ def mark_as_connected(org_uid, also_linked=False):
     Args:
         org_uid(str): org identifier
     """
+    mark_as_connected_async(org_uid, also_linked).get_result()
+
+
+@ndb.tasklet
+def mark_as_connected_async(org_uid, also_linked=False):
+    """
+    Same as mark_as_connected, but returns a future so that callers can do other work while the org save is in flight
+    (the org in the request context cache is updated straight away). The statuses are only published once the org has
+    been saved.
+
+    Args:
+        org_uid(str): org identifier
+
+    Returns:
+        ndb.Future: future which resolves once the org is saved and the statuses are published
+    """
     logging.info("marking the org as connected (status value {})".format(CONNECTED))
     org = Org.get_by_id(org_uid)
     org.status = CONNECTED
@@ -416,7 +437,7 @@ def mark_as_connected(org_uid, also_linked=False):
         org.linked_at = datetime.utcnow()
 
     org.connected_at = datetime.utcnow()
-    org.put()
+    yield org.put_async()
 
     if also_linked:
         publish_status(org_uid, LINK_STATUS_TYPE, LINK_STATUS_LINKED)
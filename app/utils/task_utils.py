@@ -1,7 +1,6 @@
 """
 Utilities for generating and managing tasks.
 """
-from itertools import izip_longest
 
 from google.appengine.api import taskqueue
 
@@ -17,18 +16,19 @@ def query_to_tasks(query, queue, task_generator):
     Returns:
         int: count of the number of tasks added to the queue
     """
-    more = True
-    cursor = None
     task_rpcs = []
     count = 0
 
-    # Only fetch keys and batch the fetch by the maximum we can add to the taskqueue in one call.
-    while more:
-        keys, cursor, more = query.fetch_page(
-            taskqueue.MAX_TASKS_PER_ADD,
-            keys_only=True,
-            start_cursor=cursor
-        )
+    # Only fetch keys and batch the fetch by the maximum we can add to the taskqueue in one call. The next page is
+    # requested before the tasks for the current one are generated so that the two overlap.
+    page = query.fetch_page_async(taskqueue.MAX_TASKS_PER_ADD, keys_only=True)
+
+    while page is not None:
+        keys, cursor, more = page.get_result()
+        page = None
+
+        if more:
+            page = query.fetch_page_async(taskqueue.MAX_TASKS_PER_ADD, keys_only=True, start_cursor=cursor)
 
         if len(keys) > 0:
             tasks = [task_generator(key) for key in keys]
@@ -54,10 +54,9 @@ def items_to_tasks(items, queue, task_generator):
         int: count of the number of tasks added to the queue
     """
     task_rpcs = []
-    # Group items by an optimal number for task enqueueing
-    # https://docs.python.org/2/library/itertools.html#recipes
-    for group in izip_longest(*([iter(items)] * taskqueue.MAX_TASKS_PER_ADD)):
-        tasks = [task_generator(item) for item in group if item is not None]
+    # Group items by the maximum number of tasks per add (one rpc each), slicing rather than padding the last group
+    for start in xrange(0, len(items), taskqueue.MAX_TASKS_PER_ADD):
+        tasks = [task_generator(item) for item in items[start:start + taskqueue.MAX_TASKS_PER_ADD]]
         task_rpcs.append(queue.add_async(tasks))
 
     # Wait for all async taskqueue adds to finish
@@ -5,6 +5,7 @@ Tests for the QBO API clients.
 import os
 import unittest
 from mock import patch, Mock
+from requests.exceptions import ConnectionError
 
 from google.appengine.ext import testbed
 from google.appengine.api import taskqueue
@@ -60,7 +61,7 @@ class QboClientTestCase(unittest.TestCase):
         session = QboApiSession('test')
 
         # successful response data comes through
-        request_mock.return_value = Mock(status_code=200, text='{"key": "value"}')
+        request_mock.return_value = Mock(status_code=200, json=Mock(return_value={"key": "value"}))
         data = session.get("https://qbo")
         self.assertEqual(data, {"key": "value"})
 
@@ -75,32 +76,35 @@ class QboClientTestCase(unittest.TestCase):
             session.get("https://qbo")
 
         # qbo notifies of some errors with 200 and Fault key in response
-        request_mock.return_value = Mock(status_code=200, text='{"Fault": "wrong"}')
+        request_mock.return_value = Mock(status_code=200, json=Mock(return_value={"Fault": "wrong"}))
         with self.assertRaises(ValueError):
             session.get("https://qbo")
 
     @patch.dict(os.environ, {'QBO_BASE_API_URI': 'http://qbo', 'QBO_API_MINOR_VERSION': '1'})
     @patch('app.clients.qbo_client.QboApiSession.refresh_token', Mock())
-    @patch('app.clients.qbo_client.QboApiSession.get')
-    def test_is_authenticated(self, get_mock):
+    @patch('app.clients.qbo_client.OAuth2Session.request')
+    def test_is_authenticated(self, request_mock):
         """
         Tests how QBO client's on-demand auth check.
         """
         org = Org(id='test', provider_config=self.test_provider_config).put()
         OrgCredentials(id='test', parent=org, token={'expires_at': 0, 'refresh_token': 'refresh'}).put()
 
-        # getting CompanyInfo means authenticated
-        get_mock.return_value = {'CompanyInfo': {'CompanyName': 'jaja'}}
+        # a successful CompanyInfo call means authenticated
+        request_mock.return_value = Mock(status_code=200)
         qbo_session = QboApiSession('test')
 
         self.assertTrue(qbo_session.is_authenticated())
 
-        # no CompanyInfo means not authenticated
-        get_mock.return_value = {'NotCompanyInfo': {}}
+        # the response body is not needed for the check
+        request_mock.return_value.json.assert_not_called()
+
+        # an unauthorized CompanyInfo call means not authenticated
+        request_mock.return_value = Mock(status_code=401)
         self.assertFalse(qbo_session.is_authenticated())
 
         # an exception means not authenticated
-        get_mock.side_effect = UnauthorizedApiCallException()
+        request_mock.side_effect = ConnectionError()
         self.assertFalse(qbo_session.is_authenticated())
 
     @patch.dict(os.environ, {'QBO_BASE_API_URI': 'http://qbo', 'QBO_API_MINOR_VERSION': '1'})
@@ -143,7 +147,7 @@ class QboClientTestCase(unittest.TestCase):
             session.request('GET', 'http://testurl.com')
 
         # 200 and non-ascii response
-        request_mock.return_value = Mock(status_code=200, text=u'{"value": "te\xa0st"}')
+        request_mock.return_value = Mock(status_code=200, json=Mock(return_value={"value": u"te\xa0st"}))
 
         # there should be no exception
         session = QboApiSession('test')
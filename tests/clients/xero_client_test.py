@@ -5,6 +5,7 @@ Tests for the Xero API clients.
 import unittest
 import json
 from mock import patch, Mock
+from requests.exceptions import ConnectionError
 
 from google.appengine.ext import testbed
 
@@ -60,7 +61,7 @@ class XeroClientTestCase(unittest.TestCase):
         session = XeroApiSession('test')
 
         # successful response data comes through
-        request_mock.return_value = Mock(status_code=200, text='{"key": "value"}')
+        request_mock.return_value = Mock(status_code=200, json=Mock(return_value={"key": "value"}))
         data = session.get("https://xero")
         self.assertEqual(data, {"key": "value"})
 
@@ -79,26 +80,29 @@ class XeroClientTestCase(unittest.TestCase):
             session.get("https://xero")
 
     @patch('app.clients.xero_client.XeroApiSession.refresh_token', Mock())
-    @patch('app.clients.xero_client.XeroApiSession.get')
-    def test_is_authenticated(self, get_mock):
+    @patch('app.clients.xero_client.OAuth1Session.request')
+    def test_is_authenticated(self, request_mock):
         """
         Tests how Xero client's on-demand auth check.
         """
         org = Org(id='test', provider_config=self.test_provider_config, entity_id='ShortCode').put()
         OrgCredentials(id='test', parent=org, token={'expires_at': 0, 'oauth_token': 'token', 'oauth_token_secret': 'secret'}).put()
 
-        # getting CompanyInfo means authenticated
-        get_mock.return_value = {'Organisations': [{'Name': 'test'}]}
+        # a successful Organisations call means authenticated
+        request_mock.return_value = Mock(status_code=200)
         xero_session = XeroApiSession('test')
 
         self.assertTrue(xero_session.is_authenticated())
 
-        # no CompanyInfo means not authenticated
-        get_mock.return_value = {'NotCompanyInfo': {}}
+        # the response body is not needed for the check
+        request_mock.return_value.json.assert_not_called()
+
+        # an unauthorized Organisations call means not authenticated
+        request_mock.return_value = Mock(status_code=401)
         self.assertFalse(xero_session.is_authenticated())
 
         # an exception means not authenticated
-        get_mock.side_effect = UnauthorizedApiCallException()
+        request_mock.side_effect = ConnectionError()
         self.assertFalse(xero_session.is_authenticated())
 
 
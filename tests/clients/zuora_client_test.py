@@ -57,7 +57,7 @@ class ZuoraClientTestCase(unittest.TestCase):
         session = ZuoraApiSession('test')
 
         # successful response data comes through
-        request_mock.return_value = Mock(status_code=200, text='{"key": "value"}')
+        request_mock.return_value = Mock(status_code=200, json=Mock(return_value={"key": "value"}))
         data = session.get("https://zuora")
         self.assertEqual(data, {"key": "value"})
 
@@ -9,7 +9,7 @@ from datetime import datetime
 from mock import patch, Mock
 
 from google.appengine.ext import testbed
-from google.appengine.api import taskqueue
+from google.appengine.api import memcache, taskqueue
 
 from app.utils.sync_utils import (
     UnauthorizedApiCallException,
@@ -17,7 +17,8 @@ from app.utils.sync_utils import (
     InvalidGrantException,
     RateLimitException,
     CONNECTED,
-    DISCONNECTED
+    DISCONNECTED,
+    SYNCED_STATUS_CACHE_KEY
 )
 from app.services.adapter import adapter
 from app.services.ndb_models import Org, OrgCredentials, OrgChangeset, ProviderConfig
@@ -101,6 +102,15 @@ class AdapterTestCase(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.json['synced'], True)
 
+        # the synced status is cached until a changeset gets published
+        OrgChangeset(org_uid='test2', publish_job_finished=True, publish_job_failed=False).put()
+        response = self.app.get('/adapter/test2/status')
+        self.assertEqual(response.json['synced'], False)
+
+        memcache.delete(SYNCED_STATUS_CACHE_KEY.format('test2'))
+        response = self.app.get('/adapter/test2/status')
+        self.assertEqual(response.json['synced'], True)
+
     @patch('app.sync_states.qbo.stages.AccountBalanceReportStage.next', Mock(return_value=(True, {})))
     @patch('app.sync_states.qbo.stages.QboApiSession.refresh_token', Mock())
     @patch('app.sync_states.qbo.stages.QboApiSession.get', Mock(return_value={}))
@@ -7,7 +7,8 @@ import unittest
 from mock import patch, Mock, call
 from datetime import datetime
 import json
-from google.appengine.ext import testbed
+from google.appengine.api import memcache
+from google.appengine.ext import ndb, testbed
 import app.clients.client_utils as utils
 
 from app.services.linker import linker
@@ -85,7 +86,7 @@ class LinkerTestCase(unittest.TestCase):
     @patch('app.clients.zuora_client.ZuoraApiSession.refresh_token', Mock())
     @patch('app.clients.zuora_client.ZuoraApiSession.get_company_name', Mock(return_value='ACUIT'))
     @patch('app.services.linker.linker.publish_status')
-    @patch('app.services.linker.linker.mark_as_connected')
+    @patch('app.services.linker.linker.mark_as_connected_async')
     @patch('app.clients.zuora_client.ZuoraTokenSession.get_and_save_token')
     @patch('app.services.linker.linker.init_update')
     def test_basic_auth(self, init_update_mock, save_token_mock, connected_mock, publish_mock):
@@ -123,7 +124,7 @@ class LinkerTestCase(unittest.TestCase):
     @patch('app.clients.zuora_client.ZuoraApiSession.refresh_token', Mock())
     @patch('app.clients.zuora_client.ZuoraApiSession.get_company_name', Mock(return_value='ACUIT'))
     @patch('app.services.linker.linker.publish_status')
-    @patch('app.services.linker.linker.mark_as_connected')
+    @patch('app.services.linker.linker.mark_as_connected_async')
     @patch('app.clients.zuora_client.ZuoraTokenSession.get_and_save_token')
     @patch('app.services.linker.linker.init_update')
     def test_basic_auth_creds_provided_by_apigee(self, init_update_mock, save_token_mock, connected_mock, publish_mock):
@@ -168,7 +169,7 @@ class LinkerTestCase(unittest.TestCase):
     @patch('app.clients.xero_client.XeroApiSession.refresh_token', Mock())
     @patch('app.clients.xero_client.XeroApiSession.get_company_name', Mock(return_value='ACUIT'))
     @patch('app.services.linker.linker.publish_status')
-    @patch('app.services.linker.linker.mark_as_connected')
+    @patch('app.services.linker.linker.mark_as_connected_async')
     @patch('app.clients.xero_client.XeroTokenSession.get_and_save_token')
     @patch('app.services.linker.linker.init_update')
     def test_oauth1(self, init_update_mock, save_token_mock, connected_mock, publish_mock):
@@ -196,7 +197,7 @@ class LinkerTestCase(unittest.TestCase):
     @patch('app.clients.qbo_client.QboApiSession.refresh_token', Mock())
     @patch('app.clients.qbo_client.QboApiSession.get_company_name', Mock(return_value='ACUIT'))
     @patch('app.services.linker.linker.publish_status')
-    @patch('app.services.linker.linker.mark_as_connected')
+    @patch('app.services.linker.linker.mark_as_connected_async')
     @patch('app.clients.qbo_client.QboTokenSession.get_and_save_token')
     @patch('app.services.linker.linker.init_update')
     def test_oauth2(self, init_update_mock, save_token_mock, connected_mock, publish_mock):
@@ -221,7 +222,7 @@ class LinkerTestCase(unittest.TestCase):
         init_update_mock.assert_called_once()
 
     @patch('app.services.linker.linker.mark_as_disconnected')
-    @patch('app.services.linker.linker.mark_as_connected')
+    @patch('app.services.linker.linker.mark_as_connected_async')
     @patch('app.services.linker.linker.publish_status', Mock())
     def test_mismatching_qbo_file(self, connected_mock, disconnected_mock):
         """
@@ -242,7 +243,7 @@ class LinkerTestCase(unittest.TestCase):
 
     @patch('app.services.linker.linker.publish_status', Mock())
     @patch('app.services.linker.linker.mark_as_disconnected')
-    @patch('app.services.linker.linker.mark_as_connected')
+    @patch('app.services.linker.linker.mark_as_connected_async')
     @patch('app.clients.xero_client.XeroApiSession.get_short_code', Mock(return_value='vlg_wont_stop'))
     @patch('app.clients.xero_client.XeroTokenSession.fetch_access_token')
     def test_mismatching_xero_file(self, fetch_token_mock, connected_mock, disconnected_mock):
@@ -271,7 +272,7 @@ class LinkerTestCase(unittest.TestCase):
         )
 
     @patch('app.services.linker.linker.mark_as_disconnected')
-    @patch('app.services.linker.linker.mark_as_connected')
+    @patch('app.services.linker.linker.mark_as_connected_async')
     @patch('app.services.linker.linker.publish_status', Mock())
     def test_auth_cancelled(self, connected_mock, disconnected_mock):
         """
@@ -356,3 +357,15 @@ class LinkerTestCase(unittest.TestCase):
         """
         response = self.app.post('/linker/qbo/test/connect?redirect_url=http://app&app_family=yeah_nah')
         self.assertEqual(response.status_code, 422)
+
+    def test_warmup(self):
+        """
+        Tests that the provider configs are loaded into memcache on warmup.
+        """
+        ndb.get_context().clear_cache()
+
+        response = self.app.get('/_ah/warmup')
+        self.assertEqual(response.status_code, 204)
+
+        for provider_config_key in self.provider_configs.values():
+            self.assertIsNotNone(memcache.get(ndb.Context._memcache_prefix + provider_config_key.urlsafe()))
@@ -5,7 +5,7 @@ Tests for the orchestrator service.
 import os
 import unittest
 import json
-from mock import patch, Mock, ANY, call
+from mock import patch, Mock, ANY
 
 from google.appengine.ext import testbed
 from google.appengine.api import taskqueue
@@ -14,6 +14,33 @@ from app.services.orchestrator import orchestrator
 from app.services.ndb_models import Org, OrgChangeset
 
 
+def published_statuses(publish_mock):
+    """
+    Extracts the changeset statuses passed to a mocked publish_changeset_statuses.
+
+    Args:
+        publish_mock(Mock): mock of the changeset statuses publish function
+
+    Returns:
+        list: (org_uid, changeset, status) tuples
+    """
+    statuses = publish_mock.call_args[0][0]
+    return [(org_changeset.org_uid, org_changeset.changeset, status) for org_changeset, status in statuses]
+
+
+def mock_get_jobs(state):
+    """
+    Creates a mock of the dataflow batch job fetch which returns the same state for every job.
+
+    Args:
+        state(str): dataflow job state
+
+    Returns:
+        function: mock of the get_jobs function
+    """
+    return lambda job_ids: {job_id: {'currentState': state} for job_id in job_ids}
+
+
 class OrchestratorTestCase(unittest.TestCase):
     """
     Tests for the orchestrator service.
@@ -167,7 +194,7 @@ class OrchestratorTestCase(unittest.TestCase):
         # no publish tasks should be created because there is nothing to publish
         self.assertEqual(len(self.taskqueue.get_filtered_tasks()), 0)
 
-    @patch('app.services.orchestrator.orchestrator.publish_changeset_status')
+    @patch('app.services.orchestrator.orchestrator.publish_changeset_statuses')
     @patch('app.services.orchestrator.orchestrator.start_template')
     def test_create_publish_job_task(self, dataflow_mock, publish_mock):
         """
@@ -211,10 +238,11 @@ class OrchestratorTestCase(unittest.TestCase):
         self.assertEqual(changeset.publish_job_count, 1)
 
         # and changeset status is published
-        publish_mock.assert_called_once_with('test0', 0, 'syncing')
+        publish_mock.assert_called_once()
+        self.assertEqual(published_statuses(publish_mock), [('test0', 0, 'syncing')])
 
     @patch('app.services.orchestrator.orchestrator.start_template', Mock(side_effect=ValueError))
-    @patch('app.services.orchestrator.orchestrator.publish_changeset_status')
+    @patch('app.services.orchestrator.orchestrator.publish_changeset_statuses')
     def test_publish_failure(self, publish_mock):
         """
         Verifies that error org changeset status is published if publish job fails to be created.
@@ -237,12 +265,12 @@ class OrchestratorTestCase(unittest.TestCase):
 
         self.assertEqual(len(self.taskqueue.get_filtered_tasks()), 0)
 
-        self.assertEqual(publish_mock.call_count, 2)
-        publish_mock.assert_has_calls([call('test0', 0, 'error'), call('test1', 0, 'error')])
+        publish_mock.assert_called_once()
+        self.assertEqual(published_statuses(publish_mock), [('test0', 0, 'error'), ('test1', 0, 'error')])
 
 
-    @patch('app.services.orchestrator.orchestrator.publish_changeset_status')
-    @patch('app.services.orchestrator.orchestrator.get_job', Mock(return_value={'currentState': 'JOB_STATE_DONE'}))
+    @patch('app.services.orchestrator.orchestrator.publish_changeset_statuses')
+    @patch('app.services.orchestrator.orchestrator.get_jobs', Mock(side_effect=mock_get_jobs('JOB_STATE_DONE')))
     def test_update_changeset_success(self, publish_mock):
         """
         Verifies that changeset publish status is updated based on the dataflow api.
@@ -263,10 +291,11 @@ class OrchestratorTestCase(unittest.TestCase):
         self.assertEqual(changeset.publish_job_status, 'JOB_STATE_DONE')
 
         # and changeset status is published
-        publish_mock.assert_called_once_with('test', 0, 'synced')
+        publish_mock.assert_called_once()
+        self.assertEqual(published_statuses(publish_mock), [('test', 0, 'synced')])
 
-    @patch('app.services.orchestrator.orchestrator.publish_changeset_status')
-    @patch('app.services.orchestrator.orchestrator.get_job', Mock(return_value={'currentState': 'JOB_STATE_FAILED'}))
+    @patch('app.services.orchestrator.orchestrator.publish_changeset_statuses')
+    @patch('app.services.orchestrator.orchestrator.get_jobs', Mock(side_effect=mock_get_jobs('JOB_STATE_FAILED')))
     def test_update_changeset_failure(self, publish_mock):
         """
         Verifies that changeset publish status is updated based on the dataflow api.
@@ -287,9 +316,10 @@ class OrchestratorTestCase(unittest.TestCase):
         self.assertEqual(changeset.publish_job_status, 'JOB_STATE_FAILED')
 
         # and changeset status is published
-        publish_mock.assert_called_once_with('test', 0, 'error')
+        publish_mock.assert_called_once()
+        self.assertEqual(published_statuses(publish_mock), [('test', 0, 'error')])
 
-    @patch('app.services.orchestrator.orchestrator.get_job', Mock(return_value={'currentState': 'JOB_STATE_RUNNING'}))
+    @patch('app.services.orchestrator.orchestrator.get_jobs', Mock(side_effect=mock_get_jobs('JOB_STATE_RUNNING')))
     def test_update_changeset_running(self):
         """
         Verifies that changeset publish status is updated based on the dataflow api.
@@ -5,15 +5,19 @@ Tests for the QBO sync implementation (tests various stages of the sync process)
 import unittest
 from mock import patch, Mock
 import json
+import re
 from datetime import datetime, date, timedelta
 
 from google.appengine.ext import testbed
 from google.appengine.api import taskqueue
 
 from app.utils.sync_utils import CONNECTED
-from app.sync_states.qbo.stages import ListApiStage, MissingItemsStage, JournalReportStage, AccountBalanceReportStage
+from app.sync_states.qbo.stages import (
+    ListApiStage, MissingItemsStage, JournalReportStage, AccountBalanceReportStage, BATCH_PAGES
+)
 from app.services.ndb_models import Org, OrgCredentials, Item, MissingItem, ProviderConfig
 from app.sync_states.qbo.ndb_models import QboSyncData
+from app.sync_states.qbo.endpoints import CDC_ENDPOINT_INDEXES
 
 LIST_API_STAGE = 1
 ACCOUNT_ENDPOINT_NAME = 'Account'
@@ -21,6 +25,10 @@ COMPANY_INFO_ENDPOINT_NAME = 'CompanyInfo'
 COMPANY_INFO_ENDPOINT_INDEX = 0
 INVOICE_ENDPOINT_NAME = 'Invoice'
 INVOICE_ENDPOINT_INDEX = 8
+PREFERENCES_ENDPOINT_NAME = 'Preferences'
+EMPLOYEE_ENDPOINT_NAME = 'Employee'
+EMPLOYEE_ENDPOINT_INDEX = 5
+TAX_RATE_ENDPOINT_INDEX = 6
 
 
 class BaseTestCase(unittest.TestCase):
@@ -86,6 +94,72 @@ class BaseTestCase(unittest.TestCase):
             }
         }
 
+    @classmethod
+    def get_mock_batch_api_response(cls, endpoint, how_many=1):
+        """
+        Utility method to create a sample response from QBO batch API, with one query response per item.
+
+        Args:
+            endpoint(str): endpoint the mock response should be created for
+            how_many(int): the number of items found
+
+        Returns:
+            dict: mock response
+        """
+        return {
+            'BatchItemResponse': [{
+                'bId': '{}'.format(index),
+                'QueryResponse': {endpoint: [item]}
+            } for index, item in enumerate(cls.get_mock_api_response(endpoint, how_many)['QueryResponse'][endpoint])]
+        }
+
+    @classmethod
+    def get_mock_paged_api_response(cls, endpoint, total):
+        """
+        Utility method to create a function returning pages of sample responses from QBO API for an endpoint, based
+        on the start position in the query.
+
+        Args:
+            endpoint(str): endpoint the mock responses should be created for
+            total(int): the number of items the endpoint has
+
+        Returns:
+            function: mock of the api get function
+        """
+        def get(url, **kwargs):
+            start_position = int(re.search(r'startposition (\d+)', url).group(1))
+            response = cls.get_mock_api_response(endpoint, max(0, min(100, total - start_position + 1)))
+            for item in response['QueryResponse'][endpoint]:
+                item['Id'] = '{}'.format(int(item['Id']) + start_position)
+            return response
+
+        return get
+
+    @classmethod
+    def get_mock_paged_batch_api_response(cls, endpoint, total):
+        """
+        Utility method to create a function returning sample responses from QBO batch API for paged queries of an
+        endpoint, based on the start position in each query.
+
+        Args:
+            endpoint(str): endpoint the mock responses should be created for
+            total(int): the number of items the endpoint has
+
+        Returns:
+            function: mock of the api post function
+        """
+        get = cls.get_mock_paged_api_response(endpoint, total)
+
+        def post(url, json=None, **kwargs):
+            return {
+                'BatchItemResponse': [{
+                    'bId': batch_item['bId'],
+                    'QueryResponse': get(batch_item['Query'])['QueryResponse']
+                } for batch_item in json['BatchItemRequest']]
+            }
+
+        return post
+
     @staticmethod
     def count_items():
         """
@@ -140,16 +214,19 @@ class ListApiStageTestCase(BaseTestCase):
         self.assertEqual(sync_data.endpoint_index, INVOICE_ENDPOINT_INDEX + 1)
 
     @patch('app.sync_states.qbo.stages.QboApiSession.refresh_token', Mock())
+    @patch('app.sync_states.qbo.stages.QboApiSession.post')
     @patch('app.sync_states.qbo.stages.QboApiSession.get')
-    def test_multiple_pages(self, get_mock):
+    def test_multiple_pages(self, get_mock, post_mock):
         """
-        Verifies that once an endpoint which returns 100 items they are saved and sync fetches the next page of the same
-        endpoint.
+        Verifies that once an endpoint which returns 100 items they are saved and sync fetches the next pages of the
+        same endpoint through one batch api call.
 
         Args:
             get_mock(Mock): mock of the api get function
+            post_mock(Mock): mock of the api post function
         """
-        get_mock.return_value = self.get_mock_api_response(INVOICE_ENDPOINT_NAME, 100)
+        get_mock.side_effect = self.get_mock_paged_api_response(INVOICE_ENDPOINT_NAME, 1000)
+        post_mock.side_effect = self.get_mock_paged_batch_api_response(INVOICE_ENDPOINT_NAME, 1000)
         self.create_org(status=CONNECTED)
 
         # set sync state so that the next pull will be invoice
@@ -164,14 +241,92 @@ class ListApiStageTestCase(BaseTestCase):
         stage = ListApiStage('test')
         stage.next(payload={})
 
-        # all items should have been stored in Item
-        self.assertEqual(self.count_items(), 100)
+        # the first page is pulled on its own, and the following ones with one batch api call
+        self.assertEqual(get_mock.call_count, 1)
+        self.assertEqual(post_mock.call_count, 1)
+
+        # all the pages pulled in the step should have been stored in Item
+        self.assertEqual(self.count_items(), (BATCH_PAGES + 1) * 100)
 
         # and start position should be shifted but the endpoint_index should stay the same
         sync_data = QboSyncData.get_by_id('test')
-        self.assertEqual(sync_data.start_position, 101)
+        self.assertEqual(sync_data.start_position, (BATCH_PAGES + 1) * 100 + 1)
         self.assertEqual(sync_data.endpoint_index, INVOICE_ENDPOINT_INDEX)
 
+    @patch('app.sync_states.qbo.stages.QboApiSession.refresh_token', Mock())
+    @patch('app.sync_states.qbo.stages.QboApiSession.post')
+    @patch('app.sync_states.qbo.stages.QboApiSession.get')
+    def test_batch_page_fault(self, get_mock, post_mock):
+        """
+        Verifies that a fault on one of the pages pulled through the batch api fails the step, and nothing is saved.
+
+        Args:
+            get_mock(Mock): mock of the api get function
+            post_mock(Mock): mock of the api post function
+        """
+        post_pages = self.get_mock_paged_batch_api_response(INVOICE_ENDPOINT_NAME, 1000)
+
+        def post(url, **kwargs):
+            response = post_pages(url, **kwargs)
+            response['BatchItemResponse'][1] = {'bId': '1', 'Fault': {'type': 'SystemFault'}}
+            return response
+
+        get_mock.side_effect = self.get_mock_paged_api_response(INVOICE_ENDPOINT_NAME, 1000)
+        post_mock.side_effect = post
+        self.create_org(status=CONNECTED)
+
+        # set sync state so that the next pull will be invoice
+        QboSyncData(
+            id='test',
+            stage_index=LIST_API_STAGE,
+            endpoint_index=INVOICE_ENDPOINT_INDEX,
+            start_position=1
+        ).put()
+
+        # run the sync
+        stage = ListApiStage('test')
+        with self.assertRaises(ValueError):
+            stage.next(payload={})
+
+        # nothing should have been stored, and the sync should carry on from the same position
+        self.assertEqual(self.count_items(), 0)
+        self.assertEqual(QboSyncData.get_by_id('test').start_position, 1)
+
+    @patch('app.sync_states.qbo.stages.QboApiSession.refresh_token', Mock())
+    @patch('app.sync_states.qbo.stages.QboApiSession.post')
+    @patch('app.sync_states.qbo.stages.QboApiSession.get')
+    def test_last_page(self, get_mock, post_mock):
+        """
+        Verifies that the sync moves onto the next endpoint once one of the pages pulled through the batch api is short.
+
+        Args:
+            get_mock(Mock): mock of the api get function
+            post_mock(Mock): mock of the api post function
+        """
+        get_mock.side_effect = self.get_mock_paged_api_response(INVOICE_ENDPOINT_NAME, 250)
+        post_mock.side_effect = self.get_mock_paged_batch_api_response(INVOICE_ENDPOINT_NAME, 250)
+        self.create_org(status=CONNECTED)
+
+        # set sync state so that the next pull will be invoice
+        QboSyncData(
+            id='test',
+            stage_index=LIST_API_STAGE,
+            endpoint_index=INVOICE_ENDPOINT_INDEX,
+            start_position=1
+        ).put()
+
+        # run the sync
+        stage = ListApiStage('test')
+        stage.next(payload={})
+
+        # all the items should have been stored in Item
+        self.assertEqual(self.count_items(), 250)
+
+        # and start position should be reset but the endpoint_index should be increased
+        sync_data = QboSyncData.get_by_id('test')
+        self.assertEqual(sync_data.start_position, 1)
+        self.assertEqual(sync_data.endpoint_index, INVOICE_ENDPOINT_INDEX + 1)
+
     @patch('app.sync_states.qbo.stages.QboApiSession.refresh_token', Mock())
     @patch('app.sync_states.qbo.stages.QboApiSession.get')
     def test_company_info_deduplication(self, get_mock):
@@ -225,6 +380,98 @@ class ListApiStageTestCase(BaseTestCase):
         # the country should be saved
         self.assertEqual(Org.get_by_id('test').country, 'AU')
 
+    @patch('app.sync_states.qbo.stages.QboApiSession.refresh_token', Mock())
+    @patch('app.sync_states.qbo.stages.QboApiSession.get')
+    def test_cdc(self, get_mock):
+        """
+        Verifies that recently synced cdc endpoints are pulled with one cdc api call at the start of the sync cycle, and
+        that the endpoints covered by it are skipped afterwards.
+
+        Args:
+            get_mock(Mock): mock of the api get function
+        """
+        recent_marker = (datetime.utcnow() - timedelta(days=1)).strftime('%Y-%m-%dT%H:%M:%S-00:00')
+        changed_marker = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S-00:00')
+        invoices = self.get_mock_api_response(INVOICE_ENDPOINT_NAME, 3)['QueryResponse'][INVOICE_ENDPOINT_NAME]
+        invoices[0]['MetaData']['LastUpdatedTime'] = changed_marker
+        invoices[1]['MetaData']['LastUpdatedTime'] = changed_marker
+        invoices[1]['status'] = 'Deleted'
+        invoices[2]['MetaData']['LastUpdatedTime'] = recent_marker
+        get_mock.return_value = {'CDCResponse': [{'QueryResponse': [{INVOICE_ENDPOINT_NAME: invoices}]}]}
+        self.create_org(status=CONNECTED)
+
+        QboSyncData(
+            id='test',
+            stage_index=LIST_API_STAGE,
+            endpoint_index=COMPANY_INFO_ENDPOINT_INDEX,
+            markers={index: recent_marker for index in CDC_ENDPOINT_INDEXES}
+        ).put()
+
+        # run the sync
+        stage = ListApiStage('test')
+        stage.next(payload={})
+
+        # the deleted invoice, and the invoice which isn't newer than the invoice marker, should not have been stored
+        self.assertEqual(self.count_items(), 1)
+        self.assertEqual(get_mock.call_args[1]['params']['changedSince'], recent_marker)
+
+        # all cdc endpoints are covered, only the invoice marker has moved
+        sync_data = QboSyncData.get_by_id('test')
+        self.assertTrue(sync_data.cdc_done)
+        self.assertEqual(sync_data.cdc_endpoint_indexes, list(CDC_ENDPOINT_INDEXES))
+        self.assertEqual(sync_data.markers[INVOICE_ENDPOINT_INDEX], changed_marker)
+        self.assertEqual(sync_data.endpoint_index, COMPANY_INFO_ENDPOINT_INDEX)
+
+        # the next steps pull company info and preferences (not supported by cdc)
+        get_mock.return_value = self.get_mock_api_response(COMPANY_INFO_ENDPOINT_NAME)
+        ListApiStage('test').next(payload={})
+        self.assertEqual(QboSyncData.get_by_id('test').endpoint_index, COMPANY_INFO_ENDPOINT_INDEX + 1)
+
+        # and then skip over account, customer, vendor and employee, which were pulled through cdc
+        get_mock.return_value = self.get_mock_api_response(PREFERENCES_ENDPOINT_NAME)
+        ListApiStage('test').next(payload={})
+        self.assertEqual(QboSyncData.get_by_id('test').endpoint_index, TAX_RATE_ENDPOINT_INDEX)
+
+    @patch('app.sync_states.qbo.stages.QboApiSession.refresh_token', Mock())
+    @patch('app.sync_states.qbo.stages.QboApiSession.get')
+    def test_cdc_unsynced_endpoint(self, get_mock):
+        """
+        Verifies that a cdc endpoint which hasn't been synced yet (no marker) is left out of the cdc call and pulled by
+        its own query, while the other cdc endpoints still use the cdc api.
+
+        Args:
+            get_mock(Mock): mock of the api get function
+        """
+        recent_marker = (datetime.utcnow() - timedelta(days=1)).strftime('%Y-%m-%dT%H:%M:%S-00:00')
+        get_mock.return_value = {'CDCResponse': [{'QueryResponse': []}]}
+        self.create_org(status=CONNECTED)
+
+        cdc_endpoint_indexes = [index for index in CDC_ENDPOINT_INDEXES if index != EMPLOYEE_ENDPOINT_INDEX]
+        QboSyncData(
+            id='test',
+            stage_index=LIST_API_STAGE,
+            endpoint_index=COMPANY_INFO_ENDPOINT_INDEX,
+            markers={index: recent_marker for index in cdc_endpoint_indexes}
+        ).put()
+
+        # run the sync
+        ListApiStage('test').next(payload={})
+
+        # employee should have been left out of the cdc call
+        self.assertNotIn(EMPLOYEE_ENDPOINT_NAME, get_mock.call_args[1]['params']['entities'].split(','))
+        self.assertEqual(get_mock.call_args[1]['params']['changedSince'], recent_marker)
+
+        sync_data = QboSyncData.get_by_id('test')
+        self.assertEqual(sync_data.cdc_endpoint_indexes, cdc_endpoint_indexes)
+
+        # company info and preferences are pulled next, and then employee is queried after skipping account, customer
+        # and vendor
+        get_mock.return_value = self.get_mock_api_response(COMPANY_INFO_ENDPOINT_NAME)
+        ListApiStage('test').next(payload={})
+        get_mock.return_value = self.get_mock_api_response(PREFERENCES_ENDPOINT_NAME)
+        ListApiStage('test').next(payload={})
+        self.assertEqual(QboSyncData.get_by_id('test').endpoint_index, EMPLOYEE_ENDPOINT_INDEX)
+
 
 class MissingItemsStageTestCase(BaseTestCase):
     """
@@ -255,25 +502,53 @@ class MissingItemsStageTestCase(BaseTestCase):
         self.assertEqual(self.count_items(), 2)
 
     @patch('app.sync_states.qbo.stages.QboApiSession.refresh_token', Mock())
-    @patch('app.sync_states.qbo.stages.QboApiSession.get')
-    def test_missing_not_found_in_item(self, get_mock):
+    @patch('app.sync_states.qbo.stages.QboApiSession.post')
+    def test_missing_not_found_in_item(self, post_mock):
         """
         Verifies that if the missing item is not found in Item it will be retrieved from the api
 
         Args:
-            get_mock(Mock): mock of the api get function
+            post_mock(Mock): mock of the api post function
         """
-        get_mock.return_value = self.get_mock_api_response(ACCOUNT_ENDPOINT_NAME)
+        post_mock.return_value = self.get_mock_batch_api_response(ACCOUNT_ENDPOINT_NAME)
         self.create_org(status=CONNECTED)
         stage = MissingItemsStage('test')
         MissingItem(org_uid='test', missing_items=[{'type': 'Account', 'id': '1'}]).put()
         stage.next(payload={})
 
         # the missing item should be deleted and resolved item should added Item ready for next publish
-        get_mock.assert_called_once()
+        post_mock.assert_called_once()
         self.assertEqual(self.count_missing_items(), 0)
         self.assertEqual(self.count_items(), 1)
 
+    @patch('app.sync_states.qbo.stages.QboApiSession.refresh_token', Mock())
+    @patch('app.sync_states.qbo.stages.QboApiSession.post')
+    def test_missing_batched(self, post_mock):
+        """
+        Verifies that missing items not found in Item are retrieved from the batch api in batches of up to 30 queries.
+
+        Args:
+            post_mock(Mock): mock of the api post function
+        """
+        second_batch = self.get_mock_batch_api_response(ACCOUNT_ENDPOINT_NAME, 5)
+        for batch_response in second_batch['BatchItemResponse']:
+            batch_response['QueryResponse'][ACCOUNT_ENDPOINT_NAME][0]['Id'] = '3{}'.format(batch_response['bId'])
+
+        post_mock.side_effect = [self.get_mock_batch_api_response(ACCOUNT_ENDPOINT_NAME, 30), second_batch]
+        self.create_org(status=CONNECTED)
+        stage = MissingItemsStage('test')
+        MissingItem(
+            org_uid='test',
+            missing_items=[{'type': 'Account', 'id': '{}'.format(item)} for item in range(0, 35)]
+        ).put()
+        stage.next(payload={})
+
+        # the missing items should be resolved with two batch calls
+        self.assertEqual(post_mock.call_count, 2)
+        self.assertEqual(len(post_mock.call_args_list[0][1]['json']['BatchItemRequest']), 30)
+        self.assertEqual(self.count_missing_items(), 0)
+        self.assertEqual(self.count_items(), 35)
+
     def test_missing_without_payload_id(self):
         """
         Verifies that a missing item without the Id field in the data can be processed.
@@ -290,22 +565,49 @@ class MissingItemsStageTestCase(BaseTestCase):
         self.assertEqual(self.count_items(), 2)
 
     @patch('app.sync_states.qbo.stages.QboApiSession.refresh_token', Mock())
-    @patch('app.sync_states.qbo.stages.QboApiSession.get')
-    def test_missing_not_found(self, get_mock):
+    @patch('app.sync_states.qbo.stages.QboApiSession.post')
+    def test_missing_batch_fault(self, post_mock):
+        """
+        Verifies that if the batch api returns a fault for a missing item, the step fails and the missing item is kept
+        so that it can be retried.
+
+        Args:
+            post_mock(Mock): mock of the api post function
+        """
+        post_mock.return_value = {
+            'BatchItemResponse': [{
+                'bId': '0',
+                'Fault': {'Error': [{'Message': 'ThrottleExceeded'}], 'type': 'ValidationFault'}
+            }]
+        }
+        self.create_org(status=CONNECTED)
+        stage = MissingItemsStage('test')
+        MissingItem(org_uid='test', missing_items=[{'type': 'Account', 'id': '1'}]).put()
+
+        with self.assertRaises(ValueError):
+            stage.next(payload={})
+
+        # the missing item should be kept for the retry, and nothing added to Item
+        self.assertEqual(self.count_missing_items(), 1)
+        self.assertEqual(self.count_items(), 0)
+
+    @patch('app.sync_states.qbo.stages.QboApiSession.refresh_token', Mock())
+    @patch('app.sync_states.qbo.stages.QboApiSession.post')
+    def test_missing_not_found(self, post_mock):
         """
         Verifies that if the missing item is not found in Item or in the API it will be deleted, but not added to Item.
 
         Args:
-            get_mock(Mock): mock of the api get function
+            post_mock(Mock): mock of the api post function
         """
-        get_mock.return_value = self.get_mock_api_response(ACCOUNT_ENDPOINT_NAME, 0)
+        post_mock.return_value = self.get_mock_batch_api_response(ACCOUNT_ENDPOINT_NAME, 0)
         self.create_org(status=CONNECTED)
         stage = MissingItemsStage('test')
         MissingItem(org_uid='test', missing_items=[{'type': 'Account', 'id': '1'}]).put()
         stage.next(payload={})
 
         # the missing item should be deleted and resolved item should added Item ready for next publish
-        get_mock.assert_called_once()
+        post_mock.assert_called_once()
         self.assertEqual(self.count_missing_items(), 0)
         self.assertEqual(self.count_items(), 0)
 
@@ -6,7 +6,7 @@ import unittest
 import json
 from datetime import datetime
 from mock import patch, Mock
-from app.utils.pubsub_utils import publish_status, publish_changeset_status
+from app.utils.pubsub_utils import publish_status, publish_changeset_status, publish_changeset_statuses
 from app.services.ndb_models import Org, OrgChangeset
 from google.appengine.ext import testbed
 
@@ -195,3 +195,31 @@ class PubsubUtilsTestCase(unittest.TestCase):
                 ]
             })
         )
+
+    @patch('app.utils.pubsub_utils.get_client')
+    @patch('app.utils.pubsub_utils.datetime', Mock(utcnow=Mock(return_value=datetime(2010, 1, 1))))
+    def test_changeset_statuses_published_in_batch(self, client_mock):
+        """
+        Verifies that the statuses of several changesets are published in one batch.
+
+        Args:
+            client_mock(Mock): mock of the pubsub client
+        """
+        synced = OrgChangeset(org_uid='test', changeset=2, publish_finished_at=datetime(2010, 1, 2))
+        failed = OrgChangeset(org_uid='test', changeset=3)
+        publish_changeset_statuses([(synced, 'synced'), (failed, 'error')])
+
+        batch_mock = client_mock.return_value.topic.return_value.batch.return_value.__enter__.return_value
+        self.assertEqual(batch_mock.publish.call_count, 2)
+
+        synced_message, error_message = [json.loads(args[0]) for args, _ in batch_mock.publish.call_args_list]
+        self.assertEqual(synced_message['data'][0]['id'], 'test_2')
+        self.assertEqual(synced_message['data'][0]['attributes']['synced_at'], '2010-01-02T00:00:00')
+        self.assertEqual(error_message['data'][0]['id'], 'test_3')
+        self.assertEqual(error_message['data'][0]['attributes']['status'], 'error')
+        self.assertIsNone(error_message['data'][0]['attributes']['synced_at'])
+
+        # nothing is published for an empty list
+        client_mock.reset_mock()
+        publish_changeset_statuses([])
+        client_mock.assert_not_called()